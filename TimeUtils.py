@@ -119,7 +119,8 @@ def call_tests(indices=[], verbose=True):
     group.add_argument("-v", "--verbose", action="store_true")
     cmd_args = parser.parse_args()
     override_print()
-    tests = globals().get('_tests', [])
+    # tests registered on import by other modules belong to their own scripts
+    tests = [t for t in globals().get('_tests', []) if t[0].__module__ == '__main__']
     for (i, (fnc, args, kwargs)) in enumerate(tests):
         if indices and i not in indices:
             continue
@@ -0,0 +1,260 @@
+"""
+Shortest path distances from many sources at once, sharded over a pool of
+processes. The graph is frozen and saved in the CSR format of csr.py, and
+every worker maps that file read-only (FrozenGraph.load with mmap), so the
+workers share one copy of the arrays through the page cache instead of
+each unpickling its own Graph. Distances come back as numpy rows indexed
+like FrozenGraph.names, or go straight into a memory-mapped matrix.
+johnson does the same for graphs with negative weights, on a copy of the
+arrays reweighted by potentials from bf.py.
+"""
+from __future__ import print_function
+import os
+import random
+import tempfile
+import multiprocessing
+from heapq import *
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+from csr import FrozenGraph
+
+_shared = {} # the worker's mapped graph and output matrix, set by init_worker
+
+def csr_dijkstra(offsets, targets, weights, source, n, with_prevs=False):
+    """Distances from the vertex at index source over CSR arrays, as a list
+    with inf for unreachable vertices. Rows are sliced out of the arrays as
+    they are settled, so a mapped graph is only paged in where it is read.
+    Returns (costs, prevs), prevs holding the index each vertex was reached
+    from (-1 for none) when with_prevs, else None"""
+    import numpy as np
+    costs = [float('inf')] * n
+    costs[source] = 0
+    prevs = [-1] * n if with_prevs else None
+    visited = [False] * n
+    fringe = [(0, source)]
+    while fringe:
+        cost, node = heappop(fringe)
+        if visited[node]:
+            continue
+        visited[node] = True
+        lo, hi = offsets[node], offsets[node+1]
+        for (v, w) in zip(targets[lo:hi].tolist(), weights[lo:hi].tolist()):
+            next_cost = cost+w
+            if next_cost < costs[v]:
+                costs[v] = next_cost
+                if with_prevs:
+                    prevs[v] = node
+                heappush(fringe, (next_cost, v))
+    if with_prevs:
+        prevs = np.array(prevs, dtype=np.int32)
+    return (np.array(costs, dtype=np.float64), prevs)
+
+def init_worker(path, out_path, with_prevs=False):
+    import numpy as np
+    g = FrozenGraph.load(path, mmap=True)
+    _shared['graph'] = g
+    _shared['offsets'] = g.offsets.tolist() # n+1 ints, read for every settled node
+    _shared['prevs'] = with_prevs
+    if out_path is not None:
+        n = len(g.names)
+        _shared['out'] = np.memmap(out_path, dtype=np.float64, mode='r+', shape=(n, n))
+
+def run_source(source):
+    """(source, row, prevs), row None once it is in the shared matrix"""
+    g = _shared['graph']
+    (row, prevs) = csr_dijkstra(_shared['offsets'], g.targets, g.weights, source,
+                                len(g.names), _shared['prevs'])
+    if 'out' in _shared:
+        _shared['out'][source] = row
+        return (source, None, prevs)
+    return (source, row, prevs)
+
+def sharded_rows(frozen, sources, processes=None, out_path=None, with_prevs=False, chunksize=4):
+    """Yields run_source's (index, row, prevs) for every vertex index in
+    sources as it finishes, over a pool that maps frozen from a temporary file"""
+    (fd, path) = tempfile.mkstemp(suffix=".csr")
+    os.close(fd)
+    try:
+        frozen.save(path)
+        processes = processes or multiprocessing.cpu_count()
+        if processes == 1:
+            init_worker(path, out_path, with_prevs)
+            try:
+                for i in sources:
+                    yield run_source(i)
+            finally:
+                _shared.clear()
+            return
+        pool = multiprocessing.Pool(processes, init_worker, (path, out_path, with_prevs))
+        try:
+            for result in pool.imap_unordered(run_source, sources, chunksize):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        os.remove(path)
+
+def multi_source_shortest_paths(g, sources=None, processes=None, out_path=None, chunksize=4):
+    """Yields (name, row) as each source finishes, in no particular order.
+    row[i] is the distance to names[i] of the frozen graph (g.freeze().names),
+    inf if unreachable. sources defaults to every vertex, processes to the
+    number of cores. With out_path workers write their rows into an (n, n)
+    float64 memmap at out_path instead, and row is None"""
+    frozen = g.freeze()
+    index = frozen.index
+    names = list(frozen.names)
+    sources = names if sources is None else list(sources)
+    for (i, row, prevs) in sharded_rows(frozen, [index[name] for name in sources],
+                                        processes, out_path, False, chunksize):
+        yield (names[i], row)
+
+def all_pairs(g, processes=None, out_path=None):
+    """(names, dist) where dist[i, j] is the distance names[i] -> names[j].
+    dist is an in-memory array, or a memmap backed by out_path that stays
+    on disk after the call"""
+    import numpy as np
+    names = list(g.freeze().names)
+    n = len(names)
+    if out_path is not None:
+        dist = np.memmap(out_path, dtype=np.float64, mode='w+', shape=(n, n))
+        dist.flush()
+        for (name, row) in multi_source_shortest_paths(g, None, processes, out_path):
+            pass
+        return (names, np.memmap(out_path, dtype=np.float64, mode='r+', shape=(n, n)))
+    index = {name: i for (i, name) in enumerate(names)}
+    dist = np.empty((n, n), dtype=np.float64)
+    for (name, row) in multi_source_shortest_paths(g, None, processes):
+        dist[index[name]] = row
+    return (names, dist)
+
+def johnson(g, processes=None, prevs=False, engine='spfa'):
+    """
+    All pairs shortest paths on a graph that may have negative weights.
+    The potentials h of bf.potentials (engine 'spfa' or 'numpy') turn every
+    weight into w + h[u] - h[v] >= 0, dijkstra runs from every vertex on
+    the reweighted CSR arrays over the pool of sharded_rows, and each row
+    is shifted back by h[v] - h[u].
+    Returns (names, dist) with dist[i, j] the distance names[i] -> names[j],
+    inf if unreachable, or (names, dist, pred) with prevs, where pred[i, j]
+    is the index of the vertex before names[j] on that path (-1 for none)
+    as int32. Raises on a negative-weight cycle, like bellman_ford
+    """
+    import numpy as np
+    from bf import potentials
+    h = potentials(g, engine)
+    frozen = g.freeze()
+    names = list(frozen.names)
+    n = len(names)
+    hs = np.array([h[name] for name in names], dtype=np.float64)
+    offsets = np.asarray(frozen.offsets, dtype=np.int64)
+    targets = np.asarray(frozen.targets, dtype=np.int64)
+    heads = np.repeat(np.arange(n), np.diff(offsets))
+    # reweighted weights are >= 0 in exact arithmetic, clip float round-off
+    weights = np.maximum(np.asarray(frozen.weights, dtype=np.float64) + hs[heads] - hs[targets], 0)
+    reweighted = FrozenGraph(frozen.names, offsets, targets, weights, frozen._values,
+                             frozen._custom_labels, frozen._source_cls, frozen.index)
+    dist = np.empty((n, n), dtype=np.float64)
+    pred = np.empty((n, n), dtype=np.int32) if prevs else None
+    for (i, row, p) in sharded_rows(reweighted, range(n), processes, None, prevs):
+        dist[i] = row - hs[i] + hs
+        if prevs:
+            pred[i] = p
+    return (names, dist, pred) if prevs else (names, dist)
+
+def test_all_pairs():
+    import dk
+    random.seed(7)
+    g = Graph.generate(60, 300, weight_range=(1, 20))
+    expected = {u: dk.dijkstra(g, u)[0] for u in g.vertices}
+    (fd, path) = tempfile.mkstemp(suffix=".dist")
+    os.close(fd)
+    try:
+        for (processes, out_path) in ((1, None), (2, None), (2, path)):
+            names, dist = all_pairs(g, processes, out_path)
+            for (i, u) in enumerate(names):
+                for (j, v) in enumerate(names):
+                    assert dist[i, j] == expected[u][v], "Wrong distance %s->%s" % (u, v)
+            del dist
+    finally:
+        os.remove(path)
+    rows = dict(multi_source_shortest_paths(g, [3, 5], processes=2))
+    assert sorted(rows) == [3, 5] and rows[5][5] == 0, "Wrong sources"
+
+def test_johnson():
+    import bf
+    import dk
+    random.seed(15)
+    g = Graph.generate(50, 200, allow_cycles=False, weight_range=(-10, 20))
+    for (processes, engine) in ((1, 'spfa'), (2, 'numpy')):
+        names, dist, pred = johnson(g, processes, prevs=True, engine=engine)
+        for (i, u) in enumerate(names):
+            costs = bf.bellman_ford(g, u)[0]
+            for (j, v) in enumerate(names):
+                assert dist[i, j] == costs[v], "Wrong distance %s->%s" % (u, v)
+                if costs[v] == float('inf') or i == j:
+                    continue
+                path = [j]
+                while path[-1] != i:
+                    path.append(pred[i, path[-1]])
+                path = [names[k] for k in path[::-1]]
+                assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == costs[v], "Path does not cost %s" % costs[v]
+    h = Graph.generate(40, 160, weight_range=(1, 20))
+    names, dist = johnson(h, 2)
+    for (i, u) in enumerate(names):
+        costs = dk.dijkstra(h, u)[0]
+        assert dist[i].tolist() == [costs[v] for v in names], "Wrong distances from %s" % u
+    h.add_edges_from([(0, 1, -30), (1, 0, 5)])
+    try:
+        johnson(h, 1)
+    except Exception as e:
+        assert "negative-weight cycle" in str(e), "Wrong error"
+    else:
+        assert False, "Missed the negative-weight cycle"
+
+@timer
+def johnson_all_pairs(g, processes):
+    return johnson(g, processes)
+
+@timer
+def bellman_ford_all_pairs(g, sources):
+    import bf
+    return [bf.bellman_ford(g, u, 'spfa') for u in sources]
+
+def test_johnson_2():
+    sizes = [10**3, 2*10**3]
+    cores = multiprocessing.cpu_count()
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, allow_cycles=False, weight_range=(-s, s))
+        for processes in sorted(set([1, cores])):
+            names, dist = johnson_all_pairs(g, processes)
+        # spfa from every source would take 100x the time of this sample
+        bellman_ford_all_pairs(g, random.sample(range(s), s // 100))
+
+@timer
+def sources_per_second(g, sources, processes):
+    for (name, row) in multi_source_shortest_paths(g, sources, processes):
+        pass
+
+def test_all_pairs_2():
+    sizes = [10**3, 10**4]
+    cores = multiprocessing.cpu_count()
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        sources = random.sample(range(s), 64)
+        for processes in sorted(set([1, 2, cores])):
+            sources_per_second(g, sources, processes)
+    print("%s cores available" % cores)
+
+if __name__ == '__main__':
+    test_all_pairs = testcase(test_all_pairs)
+    test_all_pairs_2 = testcase(test_all_pairs_2)
+    test_johnson = testcase(test_johnson)
+    test_johnson_2 = testcase(test_johnson_2)
+    call_tests(verbose=False)
+    show_stack()
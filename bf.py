@@ -1,5 +1,6 @@
 from __future__ import print_function
 import random
+from collections import Mapping, deque
 from collections import OrderedDict as OD
 from heapq import *
 
@@ -7,56 +8,448 @@ from Graph import *
 from TimeUtils import *
 from utils import *
 
+class NegativeCycleError(Exception):
+    """Raised for a negative-weight cycle, carrying the cycle and its
+    weight (see prev_cycle) when the engine can tell which one it is"""
+    def __init__(self, cycle=None, weight=None):
+        super(NegativeCycleError, self).__init__("Graph contains a negative-weight cycle")
+        self.cycle = cycle
+        self.weight = weight
+
+def prev_cycle(prevs):
+    """
+    A cycle of the predecessor graph, where v points at u for prevs[v] = (w, u),
+    as (cycle, weight) with cycle[i] -> cycle[i+1] -> ... -> cycle[0], or None.
+    Every cycle that relaxations leave in prevs has negative weight.
+    O(V): every vertex is walked once, tagged with the walk that reached it
+    """
+    walk = {}
+    for first in prevs:
+        v = first
+        while v is not None and v not in walk:
+            walk[v] = first
+            v = prevs[v][1]
+        if v is None or walk[v] != first:
+            continue
+        cycle = [v]
+        u = prevs[v][1]
+        while u != v:
+            cycle.append(u)
+            u = prevs[u][1]
+        return (cycle[::-1], sum(prevs[x][0] for x in cycle))
+    return None
+
 @timer
-def bellman_ford(g, start):
+def bellman_ford(g, start, engine='sweep'):
     """
     Finds the closest distances from u->(v in V) in graph g
     Returns either a cost for one path, or all costs and
     a dict from which paths (u->v) can be found.
+    engine: 'sweep' relaxes every edge V-1 times, 'spfa' only the
+    out-edges of vertices whose cost changed, see spfa, 'numpy' sweeps
+    edge arrays until nothing changes, see numpy_bellman_ford
     """
+    if engine == 'spfa':
+        return spfa(g, start)
+    if engine == 'numpy':
+        return numpy_bellman_ford(g, start)
+    if engine != 'sweep':
+        raise ValueError("Unknown bellman-ford engine %s" % engine)
     costs = {v: float('inf') for v in g.vertices }
     prevs = {v: (0, None) for v in g.vertices }
     costs[start] = 0
-    for i in range(1, len(g.vertices)):
+    edges = g.edgelist # cached on the graph, read once
+    for i in xrange(1, len(g.vertices)):
         # iterate to find best paths through all vertices
         # worst case for path of length v-1
-        for ((u, v), w) in g.edgelist:
+        for ((u, v), w) in edges:
             next_cost = costs[u] + w
             if next_cost < costs[v]:
                 costs[v] = next_cost
                 prevs[v] = (w, u)
     # Check for any negative-weight cycles
-    for ((u, v), w) in g.edgelist:
+    for ((u, v), w) in edges:
         if costs[u] + w < costs[v]:
-           raise Exception("Graph contains a negative-weight cycle")
+            prevs[v] = (w, u) # after V relaxing passes prevs holds a cycle
+            raise NegativeCycleError(*(prev_cycle(prevs) or ()))
+    return (costs, prevs)
+
+@timer
+def spfa(g, start):
+    """
+    Queue-based Bellman-Ford (the shortest path faster algorithm).
+    A FIFO queue holds the vertices whose cost dropped since they were
+    last expanded, and only their out-edges are relaxed, so the search
+    stops as soon as costs settle instead of after V-1 sweeps.
+    Same contract as bellman_ford: (costs, prevs), raising on a
+    negative-weight cycle reachable from start.
+    -----------------------------------------------------
+    Data Structures:
+    queued: vertices waiting in the queue, each held at most once
+    hops: edges on the current path to v. A path of V edges repeats a
+    vertex, and one that got cheaper that way runs through a negative cycle
+    """
+    costs = {v: float('inf') for v in g.vertices }
+    prevs = {v: (0, None) for v in g.vertices }
+    costs[start] = 0
+    return queue_relax(g, costs, prevs, [start])
+
+def queue_relax(g, costs, prevs, sources):
+    """The queue loop of spfa, started from every vertex of sources"""
+    hops = {s: 0 for s in sources}
+    limit = len(g.vertices)
+    queue = deque(sources)
+    queued = set(sources)
+    while queue:
+        u = queue.popleft()
+        queued.discard(u)
+        cost = costs[u]
+        for (v, w) in g[u].edges.iteritems():
+            next_cost = cost + w
+            if next_cost < costs[v]:
+                costs[v] = next_cost
+                prevs[v] = (w, u)
+                hops[v] = hops[u] + 1
+                if hops[v] >= limit:
+                    raise NegativeCycleError(*(prev_cycle(prevs) or ()))
+                if v not in queued:
+                    queued.add(v)
+                    queue.append(v)
     return (costs, prevs)
 
 @timer
-def k_bellman_ford(g, start, k=0):
+def find_negative_cycle(g, start=None, check_every=None):
+    """
+    Runs the queue of spfa and looks for a cycle in prevs every
+    check_every relaxations (V by default, so the O(V) prev_cycle walks
+    add O(1) per relaxation), stopping at the first one found instead of
+    after V passes. Searches from start, or from every vertex at cost 0
+    (a virtual source) to find a cycle anywhere in g.
+    Returns (cycle, weight) as prev_cycle does, or None once the queue
+    empties with no negative-weight cycle
+    """
+    sources = list(g.vertices) if start is None else [start]
+    costs = {v: 0 if start is None else float('inf') for v in g.vertices }
+    prevs = {v: (0, None) for v in g.vertices }
+    for s in sources:
+        costs[s] = 0
+    check_every = check_every or len(g.vertices)
+    relaxed = 0
+    queue = deque(sources)
+    queued = set(sources)
+    while queue:
+        u = queue.popleft()
+        queued.discard(u)
+        cost = costs[u]
+        for (v, w) in g[u].edges.iteritems():
+            next_cost = cost + w
+            if next_cost < costs[v]:
+                costs[v] = next_cost
+                prevs[v] = (w, u)
+                relaxed += 1
+                if relaxed % check_every == 0:
+                    found = prev_cycle(prevs)
+                    if found is not None:
+                        return found
+                if v not in queued:
+                    queued.add(v)
+                    queue.append(v)
+    return None
+
+def edge_arrays(g):
+    """
+    The edges of g as numpy arrays sorted by head, kept on the graph
+    until its version moves.
+    -----------------------------------------------------
+    names, index: vertex i is names[i]
+    src, dst, w: edge j runs src[j] -> dst[j] with weight w[j]
+    starts: first edge of every run of equal dst, heads: that dst
+    groups: the run every edge belongs to, counts: the length of every run
+    ints: whether all weights are ints, so costs can be handed back as ints
+    """
+    import numpy as np
+    cached = getattr(g, '_edge_arrays', None)
+    if cached is not None and cached[0] == g.version:
+        return cached[1]
+    names = list(g.vertices)
+    index = {name: i for (i, name) in enumerate(names)}
+    edges = g.edgelist
+    m = len(edges)
+    src = np.fromiter((index[u] for ((u, v), w) in edges), np.int64, m)
+    dst = np.fromiter((index[v] for ((u, v), w) in edges), np.int64, m)
+    w = np.fromiter((w for (e, w) in edges), np.float64, m)
+    ints = all(isinstance(c, (int, long)) for (e, c) in edges)
+    order = np.argsort(dst, kind='mergesort')
+    src, dst, w = src[order], dst[order], w[order]
+    starts = np.flatnonzero(np.r_[True, dst[1:] != dst[:-1]]) if m else np.zeros(0, np.int64)
+    counts = np.diff(np.r_[starts, m])
+    groups = np.repeat(np.arange(len(starts)), counts)
+    arrs = (names, index, src, dst, w, starts, dst[starts], groups, counts, ints)
+    g._edge_arrays = (g.version, arrs)
+    return arrs
+
+def array_sweep(arrs, dist, pred, predw):
+    """One round of relaxing every edge against the costs of the round
+    before, as a gather, an add and a segment min per head. Updates dist,
+    pred and predw in place and returns whether any cost dropped"""
+    import numpy as np
+    (names, index, src, dst, w, starts, heads, groups, counts, ints) = arrs
+    if not len(src):
+        return False
+    cand = dist[src] + w
+    best = np.minimum.reduceat(cand, starts)
+    improved = best < dist[heads]
+    if not improved.any():
+        return False
+    # the first edge of every improved run that reaches its minimum
+    hit = np.flatnonzero((cand == np.repeat(best, counts)) & np.repeat(improved, counts))
+    hit = hit[np.r_[True, groups[hit[1:]] != groups[hit[:-1]]]]
+    dist[heads[improved]] = best[improved]
+    pred[dst[hit]] = src[hit]
+    predw[dst[hit]] = w[hit]
+    return True
+
+def array_costs(arrs, dist):
+    """{name: cost} from the dist array of array_sweep"""
+    names, ints = arrs[0], arrs[-1]
+    if not ints:
+        return dict(izip(names, dist.tolist()))
+    return {name: (int(c) if c != float('inf') else c) for (name, c) in izip(names, dist.tolist())}
+
+def array_prevs(arrs, pred, predw):
+    """{name: (w, u)} from the pred and predw arrays of array_sweep"""
+    names, num = arrs[0], int if arrs[-1] else float
+    return {name: ((num(pw), names[p]) if p >= 0 else (0, None))
+            for (name, p, pw) in izip(names, pred.tolist(), predw.tolist())}
+
+def array_start(arrs, start):
+    import numpy as np
+    n = len(arrs[0])
+    dist = np.full(n, float('inf'))
+    dist[arrs[1][start]] = 0
+    return (dist, np.full(n, -1, np.int64), np.zeros(n))
+
+@timer
+def numpy_bellman_ford(g, start):
+    """
+    Bellman-Ford over the edge arrays of edge_arrays, one array_sweep per
+    round, stopping at the first round that changes nothing.
+    Same contract as bellman_ford: (costs, prevs), raising on a
+    negative-weight cycle reachable from start
+    """
+    arrs = edge_arrays(g)
+    dist, pred, predw = array_start(arrs, start)
+    for i in xrange(1, len(arrs[0])):
+        if not array_sweep(arrs, dist, pred, predw):
+            break
+    else:
+        if array_sweep(arrs, dist, pred, predw):
+            raise NegativeCycleError()
+    return (array_costs(arrs, dist), array_prevs(arrs, pred, predw))
+
+@timer
+def potentials(g, engine='spfa'):
+    """
+    Costs from a virtual source with a 0 weight edge to every vertex, the
+    potentials h of Johnson's algorithm: w + h[u] - h[v] >= 0 for every
+    edge u->v. engine: 'spfa' or 'numpy'. Raises on any negative-weight
+    cycle, reachable from the virtual source by construction
+    """
+    if engine == 'numpy':
+        import numpy as np
+        arrs = edge_arrays(g)
+        n = len(arrs[0])
+        dist, pred, predw = np.zeros(n), np.full(n, -1, np.int64), np.zeros(n)
+        for i in xrange(len(arrs[0])):
+            if not array_sweep(arrs, dist, pred, predw):
+                return array_costs(arrs, dist)
+        raise NegativeCycleError()
+    if engine != 'spfa':
+        raise ValueError("Unknown potentials engine %s" % engine)
+    costs = {v: 0 for v in g.vertices }
+    prevs = {v: (0, None) for v in g.vertices }
+    return queue_relax(g, costs, prevs, list(g.vertices))[0]
+
+@timer
+def k_bellman_ford(g, start, k=0, engine='sweep', layers='all', checkpoint=None):
     """
     Finds the closest distances from u->(v in V) in graph g
     Returns either a cost for one path, or all costs and
     a dict from which paths (u->v) can be found.
+    engine: 'sweep' or 'numpy', which runs every round as an array_sweep
+    layers: 'all' returns costs as a dict of every round's costs,
+    'rolling' keeps O(V) of them and returns a HopLayers instead, which
+    rebuilds any other round on demand, from round 0 or from the nearest
+    of the rounds snapshotted every checkpoint rounds
     """
     k = len(g.vertices)-1 if k<1 else k
+    if layers == 'rolling' or checkpoint:
+        return rolling_k_bellman_ford(g, start, k, engine, checkpoint)
+    if layers != 'all':
+        raise ValueError("Unknown layers mode %s" % layers)
+    if engine == 'numpy':
+        return numpy_k_bellman_ford(g, start, k)
+    if engine != 'sweep':
+        raise ValueError("Unknown bellman-ford engine %s" % engine)
     costs = {0: { v: float('inf') for v in g.vertices }}
     prevs = {v: (0, None) for v in g.vertices }
     costs[0][start] = 0
-    for i in range(1, k+1):
+    edges = g.edgelist # cached on the graph, read once
+    for i in xrange(1, k+1):
         # iterate to find best paths through all vertices
         # worst case for path of length k
         costs[i] = {k:v for (k,v) in costs[i-1].iteritems()}
-        for ((u, v), w) in g.edgelist:
+        for ((u, v), w) in edges:
             next_cost = costs[i-1][u] + w
             if next_cost < costs[i][v]:
                 costs[i][v] = next_cost
                 prevs[v] = (w, u)
     # Check for any negative-weight cycles
-    for ((u, v), w) in g.edgelist:
+    for ((u, v), w) in edges:
         if costs[k][u] + w < costs[k][v]:
-           raise Exception("Graph contains a negative-weight cycle")
+           raise NegativeCycleError()
     return (costs, prevs)
 
+def numpy_k_bellman_ford(g, start, k):
+    """k_bellman_ford on edge arrays. Rounds after the first one that
+    changes nothing share its costs dict"""
+    arrs = edge_arrays(g)
+    dist, pred, predw = array_start(arrs, start)
+    costs = {0: array_costs(arrs, dist)}
+    changed = True
+    for i in xrange(1, k+1):
+        changed = changed and array_sweep(arrs, dist, pred, predw)
+        costs[i] = array_costs(arrs, dist) if changed else costs[i-1]
+    if changed and array_sweep(arrs, dist, pred, predw):
+        raise NegativeCycleError()
+    return (costs, array_prevs(arrs, pred, predw))
+
+class HopLayers(Mapping):
+    """
+    The costs of k_bellman_ford by round without holding every round:
+    layers[i][v] is the min cost start -> v over paths of at most i edges.
+    -----------------------------------------------------
+    Data Structures:
+    snapshots: round -> layer for round 0, every checkpoint-th round and
+    the last round that changed anything (fixed), later rounds equal it
+    block: the rounds rebuilt by the last lookup. With checkpoints the
+    whole block up to the next snapshot is kept, so walking down the
+    rounds in path costs O(k) rounds in all, without only the round asked
+    for (path then lays temporary checkpoints every sqrt(hops) rounds)
+    step, view: one round of the engine, and its layer as a {name: cost} dict
+    """
+    def __init__(self, g, start, k, step, view, snapshots, fixed, checkpoint=None):
+        self._g = g
+        self.start = start
+        self.k = k
+        self._step = step
+        self._view = view
+        self.snapshots = snapshots
+        self.fixed = fixed
+        self.checkpoint = checkpoint
+        self._block = {}
+    def __len__(self):
+        return self.k + 1
+    def __iter__(self):
+        return iter(xrange(self.k + 1))
+    def __getitem__(self, i):
+        if not 0 <= i <= self.k:
+            raise KeyError(i)
+        return self._view(self._layer(min(i, self.fixed)))
+    def _layer(self, i):
+        if i in self.snapshots:
+            return self.snapshots[i]
+        if i not in self._block:
+            base = max(s for s in self.snapshots if s < i)
+            end = min(base + self.checkpoint - 1, self.fixed) if self.checkpoint else i
+            layer = self.snapshots[base]
+            self._block = {}
+            for j in xrange(base+1, end+1):
+                layer = self._step(layer)[0]
+                if self.checkpoint or j == i:
+                    self._block[j] = layer
+        return self._block[i]
+    def path(self, goal, hops=None):
+        """The cheapest path start -> goal of at most hops edges (all k by
+        default), walked down the rounds over the in-edges of g as read by
+        g.reversed_view(), which leaves g unindexed.
+        Same contract as dk.search: (cost, path) or (0, None)"""
+        rev = self._g.reversed_view()
+        j = self.k if hops is None else hops
+        layers = self if self.checkpoint else self._checkpointed(j)
+        layer = layers[j]
+        cost = layer[goal]
+        if cost == float('inf'):
+            return (0, None)
+        path = [goal]
+        while j > 0:
+            below = layers[j-1]
+            cur = path[-1]
+            if below[cur] != layer[cur]:
+                path.append(next(u for (u, w) in rev[cur].edges.iteritems()
+                                 if below[u] + w == layer[cur]))
+            layer, j = below, j-1
+        return (cost, path[::-1])
+    def _checkpointed(self, hops):
+        """These layers with a snapshot every sqrt(hops) rounds up to hops,
+        so that walking down from hops rebuilds every round once more"""
+        every = max(1, int(hops ** 0.5))
+        snapshots = dict(self.snapshots)
+        layer = snapshots[0]
+        for i in xrange(1, min(hops, self.fixed) + 1):
+            layer = self._step(layer)[0]
+            if i % every == 0:
+                snapshots[i] = layer
+        return HopLayers(self._g, self.start, self.k, self._step, self._view, snapshots, self.fixed, every)
+
+def rolling_k_bellman_ford(g, start, k, engine, checkpoint=None):
+    """k_bellman_ford holding two rounds at a time plus the snapshots of
+    HopLayers. Stops at the first round that changes nothing"""
+    if engine == 'numpy':
+        arrs = edge_arrays(g)
+        first, pred, predw = array_start(arrs, start)
+        scratch = array_start(arrs, start)[1:]
+        def step(layer, track=False):
+            nxt = layer.copy()
+            return (nxt, array_sweep(arrs, nxt, *((pred, predw) if track else scratch)))
+        view = lambda layer: array_costs(arrs, layer)
+        final_prevs = lambda: array_prevs(arrs, pred, predw)
+    elif engine == 'sweep':
+        first = { v: float('inf') for v in g.vertices }
+        first[start] = 0
+        prevs = {v: (0, None) for v in g.vertices }
+        edges = g.edgelist
+        def step(layer, track=False):
+            nxt = dict(layer)
+            changed = False
+            for ((u, v), w) in edges:
+                next_cost = layer[u] + w
+                if next_cost < nxt[v]:
+                    nxt[v] = next_cost
+                    changed = True
+                    if track:
+                        prevs[v] = (w, u)
+            return (nxt, changed)
+        view = lambda layer: layer
+        final_prevs = lambda: prevs
+    else:
+        raise ValueError("Unknown bellman-ford engine %s" % engine)
+    snapshots = {0: first}
+    layer, fixed = first, k
+    for i in xrange(1, k+1):
+        (nxt, changed) = step(layer, True)
+        if not changed:
+            fixed = i-1
+            break
+        layer = nxt
+        if checkpoint and i % checkpoint == 0:
+            snapshots[i] = layer
+    else:
+        if step(layer)[1]:
+            raise NegativeCycleError()
+    snapshots[fixed] = layer
+    return (HopLayers(g, start, k, step, view, snapshots, fixed, checkpoint), final_prevs())
+
 @testcase
 @timer
 def test():
@@ -103,6 +496,173 @@ def test():
     print("Found path with cost %s\nPath: %s" % (cost, path))
     assert (cost, path) == (17, [4, 9, 8, 6]), "Wrong result"
 
+@testcase
+def test_item_assignment():
+    g = Graph(range(3))
+    g.add_edges_from([(0, 1, 5), (1, 2, 5)])
+    for engine in ('sweep', 'spfa', 'numpy'):
+        assert bellman_ford(g, 0, engine)[0][2] == 10, "Wrong %s cost" % engine
+    g[0][2] = 1
+    for engine in ('sweep', 'spfa', 'numpy'):
+        assert bellman_ford(g, 0, engine)[0][2] == 1, "%s missed g[0][2] = 1" % engine
+    g[0][2] = 0
+    assert bellman_ford(g, 0, 'numpy')[0][2] == 10, "numpy missed g[0][2] = 0"
+
+@testcase
+def test_2():
+    random.seed(13)
+    for allow_cycles in (True, False):
+        low = 1 if allow_cycles else -10 # negative weights only where no cycle can form
+        g = Graph.generate(60, 240, allow_cycles, weight_range=(low, 20))
+        for u in range(0, 60, 7):
+            assert spfa(g, u)[0] == bellman_ford(g, u)[0], "spfa costs differ from %s" % u
+            assert numpy_bellman_ford(g, u)[0] == bellman_ford(g, u)[0], "numpy costs differ from %s" % u
+            assert k_bellman_ford(g, u, 0, 'numpy')[0] == k_bellman_ford(g, u)[0], "numpy rounds differ"
+            for engine in ('spfa', 'numpy'):
+                costs, prevs = bellman_ford(g, u, engine)
+                for v in g.vertices:
+                    if costs[v] < float('inf'):
+                        assert get_path(prevs, v, u)[0] == costs[v], "Wrong %s path %s->%s" % (engine, u, v)
+    g = Graph(range(5))
+    g.add_edges_from([(0, 1, 2), (1, 2, 3), (2, 3, -4), (3, 1, -1), (3, 4, 1)])
+    for engine in ('sweep', 'spfa', 'numpy'):
+        try:
+            bellman_ford(g, 0, engine)
+        except Exception as e:
+            assert "negative-weight cycle" in str(e), "Wrong error"
+        else:
+            assert False, "Missed the negative-weight cycle with %s" % engine
+
+@testcase
+def test_3():
+    sizes = [100, 10**3, 2*10**3]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        u = random.randint(0, 50)
+        assert bellman_ford(g, u, 'spfa')[0] == bellman_ford(g, u)[0], "spfa costs differ"
+
+def last_round(g, u, k, engine):
+    """Costs after round k, or the error when k rounds leave edges to relax"""
+    try:
+        return k_bellman_ford(g, u, k, engine)[0][k]
+    except Exception as e:
+        return str(e)
+
+@testcase
+def test_4():
+    sizes = [10**3, 10**4, 5*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 2*s, weight_range=(1, s))
+        edge_arrays(g)
+        u = random.randint(0, 50)
+        costs = numpy_bellman_ford(g, u)[0]
+        assert costs == spfa(g, u)[0], "numpy costs differ"
+        assert last_round(g, u, 10, 'numpy') == last_round(g, u, 10, 'sweep'), "numpy rounds differ"
+
+@testcase
+def test_5():
+    random.seed(14)
+    g = Graph.generate(50, 150, False, weight_range=(-10, 20))
+    for engine in ('sweep', 'numpy'):
+        for u in range(0, 50, 9):
+            full, prevs = k_bellman_ford(g, u, 0, engine)
+            for checkpoint in (None, 4):
+                layers, rolled = k_bellman_ford(g, u, 0, engine, 'rolling', checkpoint)
+                assert len(layers) == len(full) and rolled == prevs, "Wrong rolling prevs"
+                for i in random.sample(range(len(full)), 10) + [0, len(full) - 1]:
+                    assert layers[i] == full[i], "Round %s differs with %s" % (i, engine)
+                for v in random.sample(range(50), 10):
+                    hops = random.randint(0, 6)
+                    cost, path = layers.path(v, hops)
+                    if full[hops][v] == float('inf'):
+                        assert path is None, "Found a path that DNE"
+                        continue
+                    assert cost == full[hops][v] and len(path) <= hops + 1, "Wrong %s-hop path" % hops
+                    assert path[0] == u and path[-1] == v, "Wrong endpoints"
+                    assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    assert not g.indexed, "Walking a path indexed the graph"
+    chain = Graph(range(40))
+    chain.add_edges_from((i, i+1, 1) for i in range(39))
+    layers, prevs = k_bellman_ford(chain, 0, 0, layers='rolling')
+    rounds = [0]
+    def step(layer, track=False):
+        rounds[0] += 1
+        return sweep(layer, track)
+    sweep, layers._step = layers._step, step
+    assert layers.path(39) == (39, range(40)), "Wrong path down the chain"
+    assert rounds[0] <= 2 * layers.k, "Rebuilt %s rounds for a %s-hop path" % (rounds[0], layers.k)
+    frozen = g.freeze()
+    for v in range(0, 50, 7):
+        assert k_bellman_ford(frozen, 0, 0, layers='rolling')[0].path(v) == \
+               k_bellman_ford(g, 0, 0, layers='rolling')[0].path(v), "Frozen path differs"
+
+@testcase
+def test_6():
+    sizes = [10**3, 5*10**3]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 2*s, weight_range=(1, s))
+        u = random.randint(0, 50)
+        costs, prevs = k_bellman_ford(g, u, 200)
+        layers, prevs = k_bellman_ford(g, u, 200, layers='rolling', checkpoint=20)
+        assert layers[200] == costs[200] and layers[37] == costs[37], "Rolling rounds differ"
+        print("All rounds: %s bytes, rolling: %s bytes" % (deep_sizeof(costs), deep_sizeof(layers.snapshots)))
+
+def planted_cycle(s, e, length, seed=None):
+    """A DAG of positive weights with one negative cycle of length
+    vertices planted through it, and that cycle's weight. The ring's
+    closing edge is the only negative edge of the graph"""
+    rand = random.Random(seed)
+    g = Graph.generate(s, e, allow_cycles=False, weight_range=(1, 20), seed=seed)
+    ring = rand.sample(range(s), length)
+    weights = [rand.randint(1, 20) for i in range(length)]
+    weights[-1] = -sum(weights) - 1
+    g.add_edges_from((u, v, w) for (u, v, w) in zip(ring, ring[1:] + ring[:1], weights))
+    return (g, sum(weights))
+
+@testcase
+def test_7():
+    for seed in range(5):
+        g, weight = planted_cycle(80, 240, 5, seed)
+        assert weight < 0, "Planted a non-negative cycle"
+        for (start, every) in ((None, None), (None, 1), (0, 7)):
+            found = find_negative_cycle(g, start, every)
+            if start is not None and found is None:
+                continue # the cycle may not be reachable from start
+            cycle, total = found
+            edges = zip(cycle, cycle[1:] + cycle[:1])
+            assert all(v in g[u].edges for (u, v) in edges), "Not a cycle of g"
+            assert total == sum(g[u][v] for (u, v) in edges) < 0, "Wrong cycle weight"
+            # any negative cycle closes over the ring's negative edge, which weighs less than the ring
+            assert min(g[u][v] for (u, v) in edges) < weight, "Cycle misses the planted edge"
+        try:
+            bellman_ford(g, cycle[0], 'spfa')
+        except NegativeCycleError as e:
+            assert e.cycle is not None and e.weight < 0, "No cycle attached"
+        else:
+            assert False, "spfa missed the negative-weight cycle"
+    g = Graph.generate(80, 240, allow_cycles=False, weight_range=(-10, 20))
+    assert find_negative_cycle(g) is None, "Found a negative-weight cycle that DNE"
+
+@testcase
+def test_8():
+    sizes = [10**3, 2*10**3, 5*10**3]
+    for s in (sizes):
+        g, weight = planted_cycle(s, 5*s, 10, seed=10)
+        timed = TimeableGraph(g.adjacency_map)
+        cycle, total = find_negative_cycle(timed)
+        assert total < 0 and weight < 0, "Found a non-negative cycle"
+        start = cycle[0]
+        for engine in ('sweep', 'spfa'):
+            if engine == 'sweep' and s > 2*10**3:
+                continue
+            try:
+                bellman_ford(timed, start, engine)
+            except NegativeCycleError:
+                pass
+
 if __name__ == '__main__':
     call_tests([], verbose=False)
     show_stack()
\ No newline at end of file
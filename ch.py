@@ -0,0 +1,420 @@
+"""
+Contraction hierarchies for point-to-point queries on static graphs.
+Vertices are contracted one at a time in order of edge difference
+(shortcuts added minus edges removed), and a shortcut u->x through v is
+added whenever no path avoiding v (a witness) is as short as u->v->x.
+The result is stored as two CSR layouts over vertex ranks: up holds the
+edges v->x towards higher ranked x, down the edges x->v from higher
+ranked x, so a query is two small Dijkstra searches that only go up.
+Graphs without much hierarchy (e.g. random ones) fill up with shortcuts
+as the remaining vertices get denser, so contraction stops once their
+mean degree passes CORE_DEGREE. The uncontracted core keeps its edges in
+both layouts and queries search it like plain bidirectional Dijkstra.
+"""
+from __future__ import print_function
+import random
+from array import array
+from heapq import *
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+from generators import grid_edges
+
+WITNESS_LIMIT = 50 # most nodes a witness search settles before giving up
+CORE_DEGREE = 12 # mean out-degree of the remaining graph that stops contraction
+
+def witness_costs(out, start, skip, limit):
+    """Costs from start in the remaining graph without skip, settling at
+    most WITNESS_LIMIT nodes and none beyond limit. Missing a witness only
+    costs an extra shortcut, never a wrong distance"""
+    costs = {start: 0}
+    fringe = [(0, start)]
+    settled = 0
+    while fringe and settled < WITNESS_LIMIT:
+        cost, node = heappop(fringe)
+        if cost > limit:
+            break
+        if cost > costs[node]:
+            continue
+        settled += 1
+        for (x, (w, mid)) in out[node].iteritems():
+            next_cost = cost+w
+            if x != skip and next_cost < costs.get(x, float('inf')):
+                costs[x] = next_cost
+                heappush(fringe, (next_cost, x))
+    return costs
+
+def shortcuts(out, inn, v):
+    """The (u, x, w) shortcuts that contracting v needs"""
+    needed = []
+    if not out[v]:
+        return needed
+    top = max(w for (w, mid) in out[v].itervalues())
+    for (u, (wu, mid)) in inn[v].iteritems():
+        costs = witness_costs(out, u, v, wu + top)
+        for (x, (wx, mid)) in out[v].iteritems():
+            if x != u and costs.get(x, float('inf')) > wu + wx:
+                needed.append((u, x, wu + wx))
+    return needed
+
+class ContractionHierarchy(object):
+    """
+    Query index built by contracting every vertex of a graph.
+    -----------------------------------------------------
+    Data Structures:
+    names: vertex names, vertex i is names[i]
+    rank: contraction order of every vertex, core vertices rank last
+    up_*: CSR rows (offsets, targets, weights, mids) of v -> higher x
+    down_*: CSR rows of x -> v for higher x, stored at v
+    core: number of uncontracted vertices, their edges are in up and down
+    mids: the contracted middle vertex of a shortcut, -1 for a real edge
+    The hierarchy describes g at the version it was built for, queries
+    fall back to dk.dijkstra once the graph has changed
+    """
+    def __init__(self, g, names, rank, up, down, core=0):
+        self._g = g
+        self._version = g.version
+        self.names = names
+        self.index = {name: i for (i, name) in enumerate(names)}
+        self.rank = rank
+        self.core = core
+        (self.up_offsets, self.up_targets, self.up_weights, self.up_mids) = up
+        (self.down_offsets, self.down_targets, self.down_weights, self.down_mids) = down
+    @classmethod
+    def build(cls, g):
+        names = list(g.vertices)
+        index = {name: i for (i, name) in enumerate(names)}
+        n = len(names)
+        out = [{} for i in xrange(n)]
+        inn = [{} for i in xrange(n)]
+        for ((u, v), w) in g.iter_edges():
+            (i, j) = (index[u], index[v])
+            if i != j:
+                out[i][j] = inn[j][i] = (w, -1)
+        typecode = 'l' if all(isinstance(w, (int, long)) for ((u, v), w) in g.iter_edges()) else 'd'
+        deleted = [0] * n
+        def priority(v):
+            needed = shortcuts(out, inn, v)
+            return (len(needed) - len(out[v]) - len(inn[v]) + deleted[v], needed)
+        queue = [(priority(v)[0], v) for v in xrange(n)]
+        heapify(queue)
+        rank = [0] * n
+        ups = [None] * n
+        downs = [None] * n
+        order = 0
+        edges = sum(len(row) for row in out)
+        while queue:
+            if edges > CORE_DEGREE * (n - order):
+                break
+            (p, v) = heappop(queue)
+            (p, needed) = priority(v) # lazy update, neighbours may have moved on
+            if queue and p > queue[0][0]:
+                heappush(queue, (p, v))
+                continue
+            for (u, x, w) in needed:
+                if w < out[u].get(x, (float('inf'), -1))[0]:
+                    edges += x not in out[u]
+                    out[u][x] = inn[x][u] = (w, v)
+            edges -= len(out[v]) + len(inn[v])
+            rank[v] = order
+            order += 1
+            ups[v] = out[v].items()
+            downs[v] = inn[v].items()
+            for x in out[v]:
+                del inn[x][v]
+                deleted[x] += 1
+            for u in inn[v]:
+                del out[u][v]
+                deleted[u] += 1
+            out[v] = inn[v] = None
+        core = len(queue)
+        for (p, v) in queue:
+            rank[v] = order
+            order += 1
+            ups[v] = out[v].items()
+            downs[v] = inn[v].items()
+        return cls(g, names, rank, cls.layout(ups, typecode), cls.layout(downs, typecode), core)
+    @staticmethod
+    def layout(rows, typecode):
+        offsets, targets, weights, mids = array('l', [0]), array('l'), array(typecode), array('l')
+        for row in rows:
+            for (x, (w, mid)) in row:
+                targets.append(x)
+                weights.append(w)
+                mids.append(mid)
+            offsets.append(len(targets))
+        return (offsets, targets, weights, mids)
+    @property
+    def stale(self):
+        return self._g.version != self._version
+    @property
+    def shortcuts(self):
+        return sum(1 for m in self.up_mids if m >= 0) + sum(1 for m in self.down_mids if m >= 0)
+    @property
+    def nbytes(self):
+        arrs = (self.up_offsets, self.up_targets, self.up_weights, self.up_mids,
+                self.down_offsets, self.down_targets, self.down_weights, self.down_mids)
+        return sum(len(a) * a.itemsize for a in arrs)
+    def _upward(self, side, v):
+        """(x, w, mid) edges of v on the forward (0) or backward (1) search"""
+        if side == 0:
+            offsets, targets, weights, mids = self.up_offsets, self.up_targets, self.up_weights, self.up_mids
+        else:
+            offsets, targets, weights, mids = self.down_offsets, self.down_targets, self.down_weights, self.down_mids
+        lo, hi = offsets[v], offsets[v+1]
+        return zip(targets[lo:hi], weights[lo:hi], mids[lo:hi])
+    def _middle(self, a, b):
+        """The middle vertex of edge a->b, which sits in a's up row or b's down row"""
+        for (x, w, mid) in self._upward(0, a):
+            if x == b:
+                return mid
+        for (x, w, mid) in self._upward(1, b):
+            if x == a:
+                return mid
+        raise KeyError((a, b))
+    def unpack(self, a, b):
+        """The original vertices of edge a->b, without a"""
+        path = []
+        stack = [(a, b)]
+        while stack:
+            (u, x) = stack.pop()
+            mid = self._middle(u, x)
+            if mid < 0:
+                path.append(x)
+            else:
+                stack.append((mid, x))
+                stack.append((u, mid))
+        return path
+    def query(self, start, goal, stats=None):
+        """
+        Bidirectional upward search. The forward side follows up edges
+        from start, the backward side the down edges from goal, always
+        expanding the cheaper fringe. Every popped node is checked as a
+        meeting point, and a side stops once its fringe reaches the best
+        meeting cost (the sum of both fringes is no bound when going up).
+        Same contract as dk.search: (cost, path) or (0, None)
+        """
+        if self.stale:
+            import dk
+            print("Hierarchy is stale, running dijkstra")
+            return dk.dijkstra(self._g, start, goal, stats)
+        s, t = self.index[start], self.index[goal]
+        costs = ({s: 0}, {t: 0})
+        prevs = ({s: None}, {t: None})
+        fringes = ([(0, s)], [(0, t)])
+        settled = 0
+        best, meet = float('inf'), None
+        while True:
+            open_sides = [i for i in (0, 1) if fringes[i] and fringes[i][0][0] < best]
+            if not open_sides:
+                break
+            side = min(open_sides, key=lambda i: fringes[i][0][0])
+            cost, node = heappop(fringes[side])
+            if cost > costs[side][node]:
+                continue
+            settled += 1
+            other = costs[1-side]
+            if node in other and cost + other[node] < best:
+                best, meet = cost + other[node], node
+            for (x, w, mid) in self._upward(side, node):
+                next_cost = cost+w
+                if next_cost < costs[side].get(x, float('inf')):
+                    costs[side][x] = next_cost
+                    prevs[side][x] = node
+                    heappush(fringes[side], (next_cost, x))
+        print("Visited %s nodes" % settled)
+        if stats is not None:
+            stats['settled'] = settled
+        if meet is None:
+            print("No path to %s nodes" % settled)
+            return (0, None)
+        return (best, self._join(prevs, meet))
+    def _join(self, prevs, meet):
+        """The path of names through meet, given the prevs of a forward
+        and a backward search, with every shortcut unpacked"""
+        ups = [meet]
+        while prevs[0][ups[-1]] is not None:
+            ups.append(prevs[0][ups[-1]])
+        downs = [meet]
+        while prevs[1][downs[-1]] is not None:
+            downs.append(prevs[1][downs[-1]])
+        hops = ups[::-1] + downs[1:]
+        path = [hops[0]]
+        for (a, b) in zip(hops, hops[1:]):
+            path.extend(self.unpack(a, b))
+        return [self.names[i] for i in path]
+    def _sweep(self, side, root):
+        """(costs, prevs) of an upward search from root run to the end,
+        costs are exact only for the vertices a shortest path meets at"""
+        costs = {root: 0}
+        prevs = {root: None}
+        fringe = [(0, root)]
+        while fringe:
+            cost, node = heappop(fringe)
+            if cost > costs[node]:
+                continue
+            for (x, w, mid) in self._upward(side, node):
+                next_cost = cost+w
+                if next_cost < costs.get(x, float('inf')):
+                    costs[x] = next_cost
+                    prevs[x] = node
+                    heappush(fringe, (next_cost, x))
+        return (costs, prevs)
+    def table(self, sources, targets, paths=False):
+        """
+        Many-to-many distances: dist[i, j] is the cost sources[i] -> targets[j]
+        as a numpy matrix, inf where there is no path. A backward search
+        from every target leaves (j, cost) in a bucket at each vertex it
+        reaches, then a forward search from every source scans the buckets
+        of the vertices it reaches, so the work is |sources| + |targets|
+        upward searches rather than a dijkstra per source.
+        With paths, returns (dist, paths) where paths[i][j] is the list of
+        names on the path, or None. A stale hierarchy falls back to
+        dk.dijkstra from every source
+        """
+        import numpy as np
+        dist = np.empty((len(sources), len(targets)))
+        found = [[None] * len(targets) for s in sources] if paths else None
+        if self.stale:
+            import dk
+            print("Hierarchy is stale, running dijkstra")
+            for (i, s) in enumerate(sources):
+                costs, prevs = dk.dijkstra(self._g, s)
+                dist[i] = [costs[t] for t in targets]
+                if paths:
+                    found[i] = [get_path(prevs, t, s)[1] if costs[t] < float('inf') else None
+                                for t in targets]
+            return (dist, found) if paths else dist
+        buckets = {}
+        backs = []
+        for (j, t) in enumerate(targets):
+            costs, prevs = self._sweep(1, self.index[t])
+            for (v, cost) in costs.iteritems():
+                bucket = buckets.get(v)
+                if bucket is None:
+                    bucket = buckets[v] = []
+                bucket.append((j, cost))
+            if paths:
+                backs.append(prevs)
+        for (i, s) in enumerate(sources):
+            costs, prevs = self._sweep(0, self.index[s])
+            row = [float('inf')] * len(targets)
+            meets = [None] * len(targets)
+            for (v, cost) in costs.iteritems():
+                for (j, back) in buckets.get(v, ()):
+                    if cost + back < row[j]:
+                        row[j] = cost + back
+                        meets[j] = v
+            dist[i] = row
+            if paths:
+                found[i] = [None if meet is None else self._join((prevs, backs[j]), meet)
+                            for (j, meet) in enumerate(meets)]
+        return (dist, found) if paths else dist
+
+def test_ch():
+    import dk
+    random.seed(5)
+    grid = Graph(range(100))
+    grid.add_edges_from(grid_edges(10, 10, weight_range=(1, 9)))
+    for g in (Graph.generate(120, 360, weight_range=(1, 25)), Graph.generate(1000, 3000, weight_range=(1, 25)), grid):
+        ch = ContractionHierarchy.build(g)
+        print("%s shortcuts, %s core vertices" % (ch.shortcuts, ch.core))
+        for u in range(0, len(g.vertices), len(g.vertices) // 12):
+            costs, prevs = dk.dijkstra(g, u)
+            for v in random.sample(list(g.vertices), 100):
+                cost, path = ch.query(u, v)
+                if costs[v] == float('inf'):
+                    assert path is None, "Found a path that DNE"
+                    continue
+                assert cost == costs[v], "Wrong cost %s->%s" % (u, v)
+                assert path[0] == u and path[-1] == v, "Wrong endpoints"
+                assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    g.add_edge(0, 7, 1)
+    assert ch.stale and ch.query(0, 7) == (1, [0, 7]), "Stale hierarchy was used"
+
+def test_ch_table():
+    import dk
+    random.seed(11)
+    grid = Graph(range(144))
+    grid.add_edges_from(grid_edges(12, 12, weight_range=(1, 9)))
+    for g in (Graph.generate(150, 450, weight_range=(1, 25)), grid):
+        ch = ContractionHierarchy.build(g)
+        sources = random.sample(list(g.vertices), 12)
+        targets = random.sample(list(g.vertices), 15)
+        dist, paths = ch.table(sources, targets, paths=True)
+        assert dist.shape == (12, 15), "Wrong table shape"
+        for (i, s) in enumerate(sources):
+            costs, prevs = dk.dijkstra(g, s)
+            for (j, t) in enumerate(targets):
+                assert dist[i, j] == costs[t], "Wrong distance %s->%s" % (s, t)
+                path = paths[i][j]
+                if costs[t] == float('inf'):
+                    assert path is None, "Found a path that DNE"
+                    continue
+                assert path[0] == s and path[-1] == t, "Wrong endpoints"
+                assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == costs[t], "Path does not cost %s" % costs[t]
+    g.add_edge(sources[0], targets[0], 1)
+    assert ch.stale and ch.table(sources[:1], targets[:1])[0, 0] == 1, "Stale hierarchy was used"
+
+@timer
+def table(ch, sources, targets):
+    return ch.table(sources, targets)
+
+@timer
+def dijkstra_table(g, sources, targets):
+    import dk
+    rows = []
+    for s in sources:
+        costs = dk.dijkstra(g, s)[0]
+        rows.append([costs[t] for t in targets])
+    return rows
+
+def test_ch_table_2():
+    for side in (100, 200):
+        random.seed(10)
+        g = TimeableGraph(range(side * side))
+        g.add_edges_from(grid_edges(side, side, weight_range=(1, 100), seed=10))
+        ch = build(g)
+        places = random.sample(range(side * side), 100)
+        dist = table(ch, places, places)
+        assert dist[:5].tolist() == dijkstra_table(g, places[:5], places), "Table differs"
+
+@timer
+def build(g):
+    return ContractionHierarchy.build(g)
+
+@timer
+def queries(ch, pairs):
+    return [ch.query(u, v)[0] for (u, v) in pairs]
+
+@timer
+def searches(g, pairs):
+    import dk
+    return [dk.search(g, u, v)[0] for (u, v) in pairs]
+
+def test_ch_2():
+    sizes = [10**4, 2*10**4, 5*10**4]
+    for s in (sizes):
+        random.seed(10)
+        side = int(s ** 0.5)
+        g = TimeableGraph(range(side * side))
+        g.add_edges_from(grid_edges(side, side, weight_range=(1, 100), seed=10))
+        ch = build(g)
+        print("%s shortcuts, %s core vertices, %s bytes" % (ch.shortcuts, ch.core, ch.nbytes))
+        pairs = [(random.randint(0, side*side-1), random.randint(0, side*side-1)) for i in range(20)]
+        assert queries(ch, pairs) == searches(g, pairs), "Hierarchy costs differ"
+    # random graphs have little hierarchy, most of the work ends up in the core
+    g = TimeableGraph.generate(10**4, 3*10**4, weight_range=(1, 10**4))
+    ch = build(g)
+    print("%s shortcuts, %s core vertices, %s bytes" % (ch.shortcuts, ch.core, ch.nbytes))
+    pairs = [(random.randint(0, 10**4-1), random.randint(0, 10**4-1)) for i in range(20)]
+    assert queries(ch, pairs) == searches(g, pairs), "Hierarchy costs differ"
+
+if __name__ == '__main__':
+    test_ch = testcase(test_ch)
+    test_ch_2 = testcase(test_ch_2)
+    test_ch_table = testcase(test_ch_table)
+    test_ch_table_2 = testcase(test_ch_table_2)
+    call_tests(verbose=False)
+    show_stack()
@@ -0,0 +1,403 @@
+from __future__ import print_function
+import random
+import json
+import struct
+from array import array
+from itertools import izip, imap
+from collections import Mapping
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+
+# On-disk layout, all little endian:
+#   header  magic, vertex count n, edge count m, names kind, weight kind,
+#           length of the meta block
+#   meta    UTF-8 JSON object of names (unless kind 'r'), values,
+#           custom_labels as [key, value] pairs and the name of the class
+#           that was frozen, zero padded to 8 bytes. Plain data only, so
+#           loading a file never runs code from it (see encode_meta)
+#   arrays  int64 offsets[n+1], int64 targets[m], int64|float64 weights[m]
+MAGIC = b'ZGRAPH02'
+HEADER = struct.Struct('<8sQQcc6xQ')
+NAMES_RANGE, NAMES_LISTED = b'r', b'j'
+WEIGHT_DTYPES = {b'q': '<i8', b'd': '<f8'}
+# classes a saved graph may thaw into, stored by name
+SOURCE_CLASSES = {cls.__name__: cls for cls in (Graph, ReversibleGraph, CompactGraph, TimeableGraph)}
+
+def encode_meta(meta):
+    """meta as UTF-8 JSON. Names, values and labels must be JSON scalars
+    or (nested) tuples of them, anything else raises TypeError"""
+    return json.dumps(meta, separators=(',', ':')).encode('utf-8')
+
+def decode_meta(data):
+    """Inverse of encode_meta: JSON arrays come back as tuples inside the
+    top-level lists, and ASCII strings as str"""
+    def plain(value):
+        if isinstance(value, unicode):
+            try:
+                return str(value)
+            except UnicodeEncodeError:
+                return value
+        if isinstance(value, list):
+            return tuple(plain(v) for v in value)
+        return value
+    meta = json.loads(data.decode('utf-8'))
+    return {str(key): [plain(v) for v in value] if isinstance(value, list) else plain(value)
+            for (key, value) in meta.iteritems()}
+
+def source_name(cls):
+    """The name of the nearest whitelisted class cls derives from"""
+    return next(c.__name__ for c in cls.__mro__ if SOURCE_CLASSES.get(c.__name__) is c)
+
+def weight_typecode(weights):
+    """Picks the narrowest array typecode that holds every weight"""
+    for w in weights:
+        if type(w) not in (int, long):
+            return 'd'
+    return 'l'
+
+def is_float_array(arr):
+    """Works for both array.array and numpy arrays"""
+    if hasattr(arr, 'dtype'):
+        return arr.dtype.kind == 'f'
+    return arr.typecode in 'fd'
+
+def is_range(names):
+    return all(type(name) in (int, long) and name == i for (i, name) in enumerate(names))
+
+class RangeIndex(Mapping):
+    """The name -> index map of vertices named 0..n-1, kept as just n"""
+    __slots__ = ('_n',)
+    def __init__(self, n):
+        self._n = n
+    def __len__(self):
+        return self._n
+    def __iter__(self):
+        return iter(xrange(self._n))
+    def __contains__(self, name):
+        return type(name) in (int, long) and 0 <= name < self._n
+    def __getitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        return name
+
+class FrozenEdges(Mapping):
+    """Read-only {name: weight} view over one row of a FrozenGraph.
+    Iteration order matches the insertion order of the source graph."""
+    __slots__ = ('_graph', '_lo', '_hi')
+    def __init__(self, graph, lo, hi):
+        self._graph = graph
+        self._lo, self._hi = lo, hi
+    def __len__(self):
+        return self._hi - self._lo
+    def __iter__(self):
+        return imap(self._graph._names.__getitem__, self._graph._targets[self._lo:self._hi].tolist())
+    def __contains__(self, name):
+        return self._find(name) != -1
+    def __getitem__(self, name):
+        pos = self._find(name)
+        if pos == -1:
+            raise KeyError(name)
+        return self._graph._weights[pos:pos+1].tolist()[0]
+    def _find(self, name):
+        """Linear scan of the row, rows are as short as the out-degree"""
+        idx = self._graph._index.get(name)
+        if idx is None:
+            return -1
+        targets = self._graph._targets
+        for pos in xrange(self._lo, self._hi):
+            if targets[pos] == idx:
+                return pos
+        return -1
+    def iterkeys(self):
+        return iter(self)
+    def itervalues(self):
+        return iter(self._graph._weights[self._lo:self._hi].tolist())
+    def iteritems(self):
+        return izip(iter(self), self.itervalues())
+    def keys(self):
+        return list(self)
+    def values(self):
+        return list(self.itervalues())
+    def items(self):
+        return list(self.iteritems())
+
+class FrozenVertex(object):
+    """Lightweight Vertex stand-in that points at a row of a FrozenGraph"""
+    __slots__ = ('_graph', '_i')
+    def __init__(self, graph, i):
+        self._graph = graph
+        self._i = i
+    @property
+    def name(self):
+        return self._graph._names[self._i]
+    @property
+    def value(self):
+        values = self._graph._values
+        return values[self._i] if values is not None else self.name
+    @property
+    def edges(self):
+        offsets = self._graph._offsets
+        return FrozenEdges(self._graph, offsets[self._i], offsets[self._i+1])
+    def __getitem__(self, name):
+        return self.edges[name]
+    def get(self, name, default=None):
+        return self.edges.get(name, default)
+    def __setitem__(self, name, value):
+        raise TypeError("FrozenGraph is immutable, thaw() it first")
+
+class FrozenVertices(Mapping):
+    """The {name: vertex} mapping of a FrozenGraph, vertices are made on access"""
+    __slots__ = ('_graph',)
+    def __init__(self, graph):
+        self._graph = graph
+    def __len__(self):
+        return len(self._graph._names)
+    def __iter__(self):
+        return iter(self._graph._names)
+    def __contains__(self, name):
+        return name in self._graph._index
+    def __getitem__(self, name):
+        return FrozenVertex(self._graph, self._graph._index[name])
+    def iterkeys(self):
+        return iter(self)
+    def itervalues(self):
+        return (FrozenVertex(self._graph, i) for i in xrange(len(self)))
+    def iteritems(self):
+        return izip(iter(self), self.itervalues())
+
+class FrozenGraph(Graph):
+    """An immutable compressed sparse row (CSR) snapshot of a Graph.
+    Vertex i owns the edges in targets[offsets[i]:offsets[i+1]] with
+    matching weights, where targets hold vertex indices not names.
+    names/index translate between the two, so every algorithm written
+    against Graph (g.vertices, g[name].edges, g.edgelist) runs unchanged.
+    Vertices named 0..n-1 keep names as an xrange and need no index dict.
+    The arrays may be array.array or numpy arrays, see save and load."""
+    def __init__(self, names, offsets, targets, weights, values=None,
+                 custom_labels={}, source_cls=Graph, index=None):
+        self._names = names
+        if index is None:
+            index = RangeIndex(len(names)) if isinstance(names, xrange) else \
+                    {name: i for (i, name) in enumerate(names)}
+        self._index = index
+        self._offsets = offsets
+        self._targets = targets
+        self._weights = weights
+        self._values = values
+        self._custom_labels = custom_labels
+        self._source_cls = source_cls
+        self._vertices = FrozenVertices(self)
+        self._version = 0
+        self._edgelist = None
+        self._edge_pos = None
+        self._indexed = self._reversed = False
+    @classmethod
+    def from_graph(cls, g):
+        names = list(g.vertices)
+        if is_range(names):
+            names = xrange(len(names))
+            index = RangeIndex(len(names))
+        else:
+            index = {name: i for (i, name) in enumerate(names)}
+        offsets = array('l', [0])
+        targets = array('l')
+        weights = []
+        values = []
+        for v in g.vertices.itervalues():
+            targets.extend(index[t] for t in v.edges)
+            weights.extend(v.edges.itervalues())
+            offsets.append(len(targets))
+            values.append(v.value)
+        weights = array(weight_typecode(weights), weights)
+        if all(val == name for (val, name) in izip(values, names)):
+            values = None
+        return cls(names, offsets, targets, weights, values,
+                   dict(g._custom_labels), getattr(g, '_source_cls', type(g)), index)
+    def __getitem__(self, name):
+        return FrozenVertex(self, self._index[name])
+    def __len__(self):
+        return len(self._names)
+    @property
+    def names(self):
+        return self._names
+    @property
+    def index(self):
+        return self._index
+    @property
+    def offsets(self):
+        return self._offsets
+    @property
+    def targets(self):
+        return self._targets
+    @property
+    def weights(self):
+        return self._weights
+    @property
+    def edgelist(self):
+        """Built once, a frozen graph never changes"""
+        if self._edgelist is None:
+            names, offsets = self._names, self._offsets
+            self._edgelist = [ ((names[i], names[t]), w)
+                for i in xrange(len(names))
+                for (t, w) in izip(self._targets[offsets[i]:offsets[i+1]].tolist(),
+                                   self._weights[offsets[i]:offsets[i+1]].tolist()) ]
+        return self._edgelist
+    def iter_edges(self):
+        if self._edgelist is not None:
+            return iter(self._edgelist)
+        return (((v.name, t), w) for v in self._vertices.itervalues() for (t, w) in v.edges.iteritems())
+    @property
+    def nbytes(self):
+        """Bytes held by the CSR arrays alone"""
+        arrs = (self._offsets, self._targets, self._weights)
+        return sum(len(a) * a.itemsize for a in arrs)
+    def neighbors(self, i):
+        """(targets, weights) slices for the vertex at index i"""
+        lo, hi = self._offsets[i], self._offsets[i+1]
+        return (self._targets[lo:hi], self._weights[lo:hi])
+    def freeze(self):
+        return self
+    def save(self, path):
+        """Writes the binary layout described at the top of this module"""
+        import numpy as np
+        ranged = isinstance(self._names, xrange)
+        meta = encode_meta({
+            'names': None if ranged else list(self._names),
+            'values': None if self._values is None else list(self._values),
+            'custom_labels': sorted(self._custom_labels.iteritems()),
+            'source_cls': source_name(self._source_cls),
+        })
+        wkind = b'd' if is_float_array(self._weights) else b'q'
+        with open(path, 'wb') as outfile:
+            outfile.write(HEADER.pack(MAGIC, len(self._names), len(self._targets),
+                NAMES_RANGE if ranged else NAMES_LISTED, wkind, len(meta)))
+            outfile.write(meta)
+            outfile.write(b'\0' * (-len(meta) % 8))
+            np.asarray(self._offsets, dtype='<i8').tofile(outfile)
+            np.asarray(self._targets, dtype='<i8').tofile(outfile)
+            np.asarray(self._weights, dtype=WEIGHT_DTYPES[wkind]).tofile(outfile)
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Reads a graph written by save. With mmap the CSR arrays are
+        numpy.memmap views of the file, so opening costs only the header
+        and name table, and processes loading the same file share pages"""
+        import numpy as np
+        with open(path, 'rb') as infile:
+            (magic, n, m, nkind, wkind, meta_len) = HEADER.unpack(infile.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError("%s is not a saved graph" % path)
+            meta = decode_meta(infile.read(meta_len))
+            start = HEADER.size + meta_len + (-meta_len % 8)
+            layout = [('<i8', n+1), ('<i8', m), (WEIGHT_DTYPES[wkind], m)]
+            arrays = []
+            for (dtype, count) in layout:
+                if mmap:
+                    arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=start, shape=(count,)))
+                else:
+                    infile.seek(start)
+                    arrays.append(np.fromfile(infile, dtype=dtype, count=count))
+                start += count * np.dtype(dtype).itemsize
+        names = xrange(n) if nkind == NAMES_RANGE else meta['names']
+        offsets, targets, weights = arrays
+        if meta['source_cls'] not in SOURCE_CLASSES:
+            raise ValueError("%s was saved from unknown class %s" % (path, meta['source_cls']))
+        return cls(names, offsets, targets, weights, meta['values'],
+                   dict(meta['custom_labels']), SOURCE_CLASSES[meta['source_cls']])
+    def thaw(self, cls=None):
+        """Returns a mutable copy, by default of the class that was frozen"""
+        cls = self._source_cls if cls is None else cls
+        g = cls([], self._custom_labels)
+        for (i, name) in enumerate(self._names):
+            value = self._values[i] if self._values is not None else None
+            g.add_vertex(name, value)
+        for ((u, v), w) in self.edgelist:
+            g.add_edge(u, v, w)
+        return g
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenGraph is immutable, thaw() it first")
+    add_vertex = remove_vertex = add_edge = remove_edge = _immutable
+    add_edges_from = remove_edges_from = remove_all_edges = _immutable
+    reverse = index_in_edges = _immutable
+
+class TimeableFrozenGraph(FrozenGraph):
+    @classmethod
+    @timer
+    def from_graph(cls, g):
+        return super(TimeableFrozenGraph, cls).from_graph(g)
+
+def test_freeze():
+    g = Graph({i: {j: i for j in range(i)} for i in range(6)})
+    f = g.freeze()
+    print(f)
+    assert f.edgelist == g.edgelist, "Frozen edges differ"
+    assert f[4].edges == g[4].edges, "Frozen row differs"
+    assert f[4][2] == 4 and f[4].get(5) is None, "Frozen lookup failed"
+    assert f.is_path(5, 0) and not f.is_path(0, 5), "Frozen traversal failed"
+    t = f.thaw()
+    assert type(t) == Graph and t.edgelist == g.edgelist, "Thaw did not round trip"
+    try:
+        f.add_edge(0, 1)
+    except TypeError:
+        print("Frozen graph refused a mutation")
+    else:
+        raise AssertionError("Frozen graph accepted a mutation")
+    for (method, edges) in (('add_edges_from', [(0, 1, 1)]), ('remove_edges_from', [(4, 2)])):
+        try:
+            getattr(f, method)(edges)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("Frozen graph accepted %s" % method)
+    assert f.edgelist == g.edgelist, "Frozen edges changed"
+
+@timer
+def scan(g):
+    return sum(1 for v in g.vertices.itervalues() for e in v.edges.iteritems())
+
+def test_save():
+    import os, tempfile
+    graphs = [Graph.generate(50, 300, weight_range=(1, 9), seed=4),
+              Graph({"A": {"B": 0.5, "C": 2.0}, "B": {"C": 1.5}, "C": {}}),
+              CompactGraph({(0, "x"): {u"\u00e9": 3}, u"\u00e9": {}}, custom_labels={1: "one"})]
+    for g in graphs:
+        (fd, path) = tempfile.mkstemp(suffix=".graph")
+        os.close(fd)
+        try:
+            g.save(path)
+            for mmap in (True, False):
+                f = Graph.load(path, mmap)
+                assert f.edgelist == g.edgelist, "Loaded edges differ"
+                assert f.thaw().adjacency_map == g.adjacency_map, "Loaded graph did not thaw"
+                assert type(f.thaw()) == type(g) and f._custom_labels == g._custom_labels, "Loaded meta differs"
+            with open(path, 'r+b') as infile:
+                data = infile.read()
+                infile.seek(data.index(b'"source_cls":"') + len(b'"source_cls":"'))
+                infile.write(b'X') # no such class
+            try:
+                Graph.load(path)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("Loaded a graph of an unknown class")
+        finally:
+            os.remove(path)
+
+def test_freeze_2():
+    sizes = [100, 10**3, 10**4, 5*10**4]
+    for s in (sizes):
+        random.seed(10)
+        TimeableGraph.set_weight_range(1,s)
+        g = TimeableGraph.generate(s, 10*s)
+        f = TimeableFrozenGraph.from_graph(g)
+        before, after = deep_sizeof(g), deep_sizeof(f)
+        print("Graph: %s bytes, FrozenGraph: %s bytes (%0.1fx)" % (before, after, float(before)/after))
+        assert scan(g) == scan(f), "Scans disagree"
+
+if __name__ == '__main__':
+    test_freeze = testcase(test_freeze)
+    test_save = testcase(test_save)
+    test_freeze_2 = testcase(test_freeze_2)
+    call_tests(verbose=False)
+    show_stack()
@@ -1,5 +1,6 @@
 from __future__ import print_function
 import random
+import struct
 from collections import deque
 from collections import OrderedDict as OD
 from heapq import *
@@ -8,19 +9,58 @@ from Graph import *
 from TimeUtils import *
 from utils import *
 
-from experiments.queue import PriorityQueue
+from experiments.queue import PriorityQueue, HeapFrontier, DialFrontier, RadixHeap
 
-def search(g, start, goal):
+DIAL_MAX_WEIGHT = 1024 # largest edge weight that dijkstra runs on Dial's buckets
+FRONTIERS = {
+    'heap': lambda hi: HeapFrontier(),
+    'dial': lambda hi: DialFrontier(hi),
+    'radix': lambda hi: RadixHeap(),
+    'indexed': lambda hi: PriorityQueue(),
+}
+
+def weight_span(g):
+    """(lowest, highest, all ints) over the edge weights of g, kept on the
+    graph until its version moves"""
+    cached = getattr(g, '_weight_span', None)
+    if cached is not None and cached[0] == g.version:
+        return cached[1]
+    lo, hi, ints = 0, 0, True
+    for (e, w) in g.iter_edges():
+        lo, hi = min(lo, w), max(hi, w)
+        ints = ints and isinstance(w, (int, long))
+    g._weight_span = (g.version, (lo, hi, ints))
+    return (lo, hi, ints)
+
+def pick_frontier(g):
+    """dial for small non-negative int weights, radix for larger ones,
+    the heap for anything else"""
+    lo, hi, ints = weight_span(g)
+    if not ints or lo < 0:
+        return 'heap'
+    return 'dial' if hi <= DIAL_MAX_WEIGHT else 'radix'
+
+def search(g, start, goal, bidirectional=False, stats=None, landmarks=None):
     """Finds the closest path u->v on graph g
     if the path DNE:
         return (0, None)
     else:
         return (cost, path)
+    bidirectional meets a forward and a backward search in the middle,
+    see bidirectional_dijkstra. Graphs with cached trees (see
+    spt.cache_trees) answer from them, graphs with landmarks (see
+    preprocess) are searched with astar
     """
-    return dijkstra(g, start, goal)
+    if bidirectional:
+        return bidirectional_dijkstra(g, start, goal, stats)
+    if getattr(g, '_trees', None) is not None:
+        return g._trees.query(start, goal, stats)
+    if landmarks is not None or getattr(g, '_landmarks', None) is not None:
+        return astar(g, start, goal, landmarks, stats)
+    return dijkstra(g, start, goal, stats)
 
 @timer
-def dijkstra(g, start, goal=None):
+def dijkstra(g, start, goal=None, stats=None, frontier='auto'):
     """
     Finds the closest distances from u->(v in V) in graph g
     Returns either a cost for one path, or all costs and
@@ -35,19 +75,36 @@ def dijkstra(g, start, goal=None):
     visited: which vertices have been visited
     costs: min cost from u->v (v,w)
     prevs: min edge u from v with weight w (w,v)
+    stats: optional dict, receives the number of settled nodes
+    frontier: 'heap', 'dial', 'radix' or 'auto' to pick by the weights.
+    'indexed' updates vertices in place (experiments.queue.PriorityQueue)
+    so the fringe never holds more than one entry per vertex.
+    dial and radix raise ValueError on a weight they cannot bucket, under
+    'auto' the search then starts over on the heap
     """
+    if frontier == 'auto':
+        try:
+            return settle(g, start, goal, stats, pick_frontier(g))
+        except ValueError as e:
+            print("%s, running dijkstra on the heap" % e)
+            frontier = 'heap'
+    return settle(g, start, goal, stats, frontier)
+
+def settle(g, start, goal, stats, frontier):
+    """The search of dijkstra on the named frontier"""
     visited = OD()
     costs = {v: float('inf') for v in g.vertices }
     prevs = {v: (0, None) for v in g.vertices }
-    fringe = []
-    heappush(fringe, (0, start))
-    # costs[start] = 0
-    # fringe = PriorityQueue(costs)
+    fringe = FRONTIERS[frontier](weight_span(g)[1] if frontier == 'dial' else None)
+    push, pop = fringe.push, fringe.pop
+    push(0, start)
+    costs[start] = 0
     while fringe:
-        cost, node = heappop(fringe) # pop the min element
-        # cost, node = fringe.pop()
+        cost, node = pop() # pop the min element
         if goal != None and node == goal:
             print("Visited %s nodes" % len(visited))
+            if stats is not None:
+                stats['settled'] = len(visited)
             return get_path(prevs, goal, start)
         if node in visited:
             continue
@@ -57,14 +114,267 @@ def dijkstra(g, start, goal=None):
             if next_cost < costs[v]:
                 costs[v] = next_cost
                 prevs[v] = (w, node)
-                heappush(fringe, (next_cost, v))
-                # fringe[v] = next_cost
+                push(next_cost, v)
     print("Visited %s nodes" % len(visited))
-    if not search:
+    if stats is not None:
+        stats['settled'] = len(visited)
+    if goal == None:
         return (costs, prevs)
     print("No path to %s nodes" % len(visited))
     return (0, None)
 
+def iter_dijkstra(g, start):
+    """
+    Yields (node, cost, prev) for every vertex reachable from start in the
+    order Dijkstra settles them, so costs never decrease. prev is the edge
+    (w, u) that reached node, (0, None) for start, as kept in prevs.
+    Only the vertices reached so far are held, a caller that stops early
+    pays for the nodes it saw and not for the whole graph
+    """
+    costs = {start: 0}
+    settled = set()
+    prevs = {start: (0, None)}
+    fringe = [(0, start)]
+    while fringe:
+        cost, node = heappop(fringe)
+        if node in settled:
+            continue
+        settled.add(node)
+        yield (node, cost, prevs.pop(node))
+        for (v, w) in g[node].edges.iteritems():
+            next_cost = cost+w
+            if v not in settled and next_cost < costs.get(v, float('inf')):
+                costs[v] = next_cost
+                prevs[v] = (w, node)
+                heappush(fringe, (next_cost, v))
+
+def nearest(g, start, k):
+    """The k closest vertices to start (start itself excluded) as
+    (node, cost) pairs, closest first"""
+    found = []
+    for (node, cost, prev) in iter_dijkstra(g, start):
+        if len(found) == k:
+            break
+        if node != start:
+            found.append((node, cost))
+    return found
+
+def within(g, start, radius):
+    """Every vertex at most radius away from start as (node, cost) pairs,
+    closest first"""
+    found = []
+    for (node, cost, prev) in iter_dijkstra(g, start):
+        if cost > radius:
+            break
+        found.append((node, cost))
+    return found
+
+def find_first(g, start, predicate):
+    """The closest vertex v with predicate(v) true.
+    Same contract as search: (cost, path) or (0, None)"""
+    prevs = {}
+    for (node, cost, prev) in iter_dijkstra(g, start):
+        prevs[node] = prev
+        if predicate(node):
+            return get_path(prevs, node, start)
+    return (0, None)
+
+@timer
+def bidirectional_dijkstra(g, start, goal, stats=None):
+    """
+    Finds the closest path start->goal by growing a forward search from
+    start on g and a backward search from goal on the reversed edges,
+    always expanding the side with the cheaper fringe. best holds the
+    cheapest start->goal path seen over an edge joining the two searches,
+    and once the two fringe minimums add up to at least best no shorter
+    path can remain. Same contract as search: (cost, path) or (0, None).
+    -----------------------------------------------------
+    Data Structures:
+    costs[i]: min cost from start (i=0) or to goal (i=1)
+    prevs[i]: the edge (w, u) that reached v on side i
+    settled[i]: the vertices side i has finalized
+    stats: optional dict, receives the number of settled nodes
+    """
+    if start == goal:
+        if stats is not None:
+            stats['settled'] = 0
+        return (0, [start])
+    graphs = (g, g.reversed_view())
+    costs = ({start: 0}, {goal: 0})
+    prevs = ({start: (0, None)}, {goal: (0, None)})
+    settled = (set(), set())
+    fringes = ([(0, start)], [(0, goal)])
+    best, meet = float('inf'), None
+    while fringes[0] and fringes[1]:
+        if fringes[0][0][0] + fringes[1][0][0] >= best:
+            break
+        side = 0 if fringes[0][0][0] <= fringes[1][0][0] else 1
+        cost, node = heappop(fringes[side])
+        if node in settled[side]:
+            continue
+        settled[side].add(node)
+        other = costs[1-side]
+        for (v, w) in graphs[side][node].edges.iteritems():
+            next_cost = cost+w
+            if next_cost < costs[side].get(v, float('inf')):
+                costs[side][v] = next_cost
+                prevs[side][v] = (w, node)
+                heappush(fringes[side], (next_cost, v))
+            if v in other and next_cost + other[v] < best:
+                best, meet = next_cost + other[v], v
+    visits = len(settled[0]) + len(settled[1])
+    print("Visited %s nodes" % visits)
+    if stats is not None:
+        stats['settled'] = visits
+    if meet is None:
+        print("No path to %s nodes" % visits)
+        return (0, None)
+    # both trees only improve after meet was recorded, so this path costs best
+    cost, head = get_path(prevs[0], meet, start)
+    tail = [meet]
+    while tail[-1] != goal:
+        tail.append(prevs[1][tail[-1]][1])
+    return (best, head + tail[1:])
+
+class Landmarks(object):
+    """ALT preprocessing: exact distances between k landmarks and every
+    vertex, giving A* lower bounds by the triangle inequality
+        d(v, goal) >= d(L, goal) - d(L, v)
+        d(v, goal) >= d(v, L) - d(goal, L)
+    -----------------------------------------------------
+    Data Structures:
+    names: vertex names, row i of the tables is names[i]
+    fwd: (k, n) array of d(L, v), inf where v is unreachable
+    bwd: (k, n) array of d(v, L)
+    The tables describe g at the version they were built for, stale
+    tells when the graph has moved on since
+    """
+    def __init__(self, g, names, rows, fwd, bwd):
+        self._g = g
+        self._version = g.version
+        self.names = names
+        self.index = {name: i for (i, name) in enumerate(names)}
+        self.rows = rows
+        self.fwd = fwd
+        self.bwd = bwd
+    @classmethod
+    def build(cls, g, k=8, strategy='farthest', seed=None):
+        """Picks k landmarks, at random or farthest-first: each new landmark
+        is the vertex furthest (round trip) from all landmarks so far"""
+        import numpy as np
+        names = list(g.vertices)
+        k = min(k, len(names))
+        rand = random.Random(seed) if seed is not None else random
+        rev = g.reversed_view()
+        fwd = np.empty((k, len(names)))
+        bwd = np.empty((k, len(names)))
+        if strategy == 'random':
+            rows = rand.sample(range(len(names)), k)
+        elif strategy == 'farthest':
+            rows = [rand.randrange(len(names))]
+        else:
+            raise ValueError("Unknown landmark strategy %s" % strategy)
+        for i in xrange(k):
+            if i == len(rows):
+                spread = (fwd[:i] + bwd[:i]).min(axis=0)
+                spread[rows] = -1
+                rows.append(int(spread.argmax()))
+            costs, prevs = dijkstra(g, names[rows[i]])
+            fwd[i] = [costs[v] for v in names]
+            costs, prevs = dijkstra(rev, names[rows[i]])
+            bwd[i] = [costs[v] for v in names]
+        return cls(g, names, rows, fwd, bwd)
+    @property
+    def landmarks(self):
+        return [self.names[i] for i in self.rows]
+    @property
+    def stale(self):
+        return self._g.version != self._version
+    @property
+    def nbytes(self):
+        return self.fwd.nbytes + self.bwd.nbytes
+    def bounds(self, goal):
+        """Lower bounds on d(v, goal) for every v, by row. inf-inf pairs
+        (v and goal both unreachable from a landmark) give no bound"""
+        import numpy as np
+        i = self.index[goal]
+        with np.errstate(invalid='ignore'):
+            diffs = np.vstack((self.fwd[:, i:i+1] - self.fwd, self.bwd - self.bwd[:, i:i+1]))
+        return np.fmax(np.fmax.reduce(diffs, axis=0), 0).tolist()
+    def save(self, path):
+        """Writes the tables next to a saved graph, e.g. to path.alt: the
+        length of a meta block of names, rows and edge count in the plain
+        encoding of csr.py, the meta block, then fwd and bwd with numpy.save"""
+        import numpy as np
+        from csr import encode_meta
+        meta = encode_meta({'names': self.names, 'rows': self.rows, 'edges': len(self._g.edgelist)})
+        with open(path, 'wb') as outfile:
+            outfile.write(struct.pack('<Q', len(meta)))
+            outfile.write(meta)
+            np.save(outfile, self.fwd)
+            np.save(outfile, self.bwd)
+    @classmethod
+    def load(cls, path, g):
+        """Reads tables written by save and attaches them to g, which has
+        to have the same vertices and number of edges"""
+        import numpy as np
+        from csr import decode_meta
+        with open(path, 'rb') as infile:
+            (meta_len,) = struct.unpack('<Q', infile.read(8))
+            saved = decode_meta(infile.read(meta_len))
+            fwd = np.load(infile, allow_pickle=False)
+            bwd = np.load(infile, allow_pickle=False)
+        if saved['names'] != list(g.vertices) or saved['edges'] != len(g.edgelist):
+            raise ValueError("%s was built for a different graph" % path)
+        g._landmarks = cls(g, saved['names'], saved['rows'], fwd, bwd)
+        return g._landmarks
+
+def preprocess(g, k=8, strategy='farthest', seed=None):
+    """Builds ALT landmarks for g and keeps them on the graph for search"""
+    g._landmarks = Landmarks.build(g, k, strategy, seed)
+    return g._landmarks
+
+@timer
+def astar(g, start, goal, landmarks=None, stats=None):
+    """
+    A* from start to goal guided by the landmark bounds of g (or the
+    landmarks given). The bounds are consistent, so every node is still
+    settled once. Falls back to dijkstra when there are no landmarks or
+    the graph changed after they were built.
+    Same contract as search: (cost, path) or (0, None)
+    """
+    landmarks = getattr(g, '_landmarks', None) if landmarks is None else landmarks
+    if landmarks is None or landmarks.stale:
+        print("No current landmarks, running dijkstra")
+        return dijkstra(g, start, goal, stats)
+    h, index = landmarks.bounds(goal), landmarks.index
+    visited = set()
+    costs = {start: 0}
+    prevs = {start: (0, None)}
+    fringe = [(h[index[start]], 0, start)]
+    while fringe:
+        est, cost, node = heappop(fringe)
+        if node == goal:
+            print("Visited %s nodes" % len(visited))
+            if stats is not None:
+                stats['settled'] = len(visited)
+            return get_path(prevs, goal, start)
+        if node in visited:
+            continue
+        visited.add(node)
+        for (v, w) in g[node].edges.iteritems():
+            next_cost = cost+w
+            bound = h[index[v]]
+            if next_cost < costs.get(v, float('inf')) and bound != float('inf'):
+                costs[v] = next_cost
+                prevs[v] = (w, node)
+                heappush(fringe, (next_cost + bound, next_cost, v))
+    print("Visited %s nodes" % len(visited))
+    if stats is not None:
+        stats['settled'] = len(visited)
+    print("No path to %s nodes" % len(visited))
+    return (0, None)
+
 @testcase
 @timer
 def test():
@@ -95,11 +405,13 @@ def test():
     cost, path = search(g, 6, 4)
     print("Found path with cost %s\nPath: %s" % (cost, path))
     assert (cost, path) == (17, [6, 8, 9, 4]), "Wrong result"
+    assert search(g, 6, 4, bidirectional=True) == (17, [6, 8, 9, 4]), "Wrong bidirectional result"
     g.reverse()
     # g.display()
     cost, path = search(g, 4, 6)
     print("Found path with cost %s\nPath: %s" % (cost, path))
     assert (cost, path) == (17, [4, 9, 8, 6]), "Wrong result"
+    assert search(g, 4, 6, bidirectional=True) == (17, [4, 9, 8, 6]), "Wrong bidirectional result"
 
 @testcase
 def test_2():
@@ -124,11 +436,166 @@ def test_3():
         g = TimeableGraph.generate(s, 10*s)
         u,v = random.randint(0,50), random.randint(0,50)
         print("Searching for the shortest path %s --> %s" % (u,v))
-        cost, path = search(g, u, v)
+        one, two = {}, {}
+        cost, path = search(g, u, v, stats=one)
         print("Found path with cost %s\nPath: %s" % (cost, path))
+        assert search(g, u, v, bidirectional=True, stats=two)[0] == cost, "Bidirectional cost differs"
+        print("Settled %s nodes one way, %s bidirectionally" % (one['settled'], two['settled']), level=1)
+
+@testcase
+def test_4():
+    random.seed(3)
+    g = Graph.generate(60, 150, weight_range=(1, 20))
+    for u in range(0, 60, 5):
+        costs, prevs = dijkstra(g, u)
+        for v in g.vertices:
+            cost, path = search(g, u, v, bidirectional=True)
+            if costs[v] == float('inf'):
+                assert path is None, "Found a path that DNE"
+                continue
+            assert cost == costs[v], "Wrong cost %s->%s" % (u, v)
+            assert path[0] == u and path[-1] == v, "Wrong endpoints"
+            assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    assert not g.indexed, "Bidirectional search indexed the graph"
+    adj = g._transposed[1]
+    search(g, 0, 59, bidirectional=True)
+    assert g._transposed[1] is adj, "Reverse adjacency was rebuilt for an unchanged graph"
+    frozen = g.freeze()
+    for v in range(0, 60, 7):
+        assert search(frozen, 0, v, bidirectional=True) == search(g, 0, v, bidirectional=True), "Frozen search differs"
+
+@testcase
+def test_5():
+    import os
+    import tempfile
+    random.seed(8)
+    g = Graph.generate(80, 240, weight_range=(1, 30))
+    for strategy in ('farthest', 'random'):
+        landmarks = Landmarks.build(g, 4, strategy)
+        for u in range(0, 80, 7):
+            costs, prevs = dijkstra(g, u)
+            for v in g.vertices:
+                cost, path = astar(g, u, v, landmarks)
+                if costs[v] == float('inf'):
+                    assert path is None, "Found a path that DNE"
+                    continue
+                assert cost == costs[v], "Wrong %s A* cost %s->%s" % (strategy, u, v)
+                assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    preprocess(g, 4)
+    (fd, path) = tempfile.mkstemp(suffix=".alt")
+    os.close(fd)
+    try:
+        g._landmarks.save(path)
+        h = Graph(g.adjacency_map)
+        loaded = Landmarks.load(path, h)
+        assert loaded.landmarks == g._landmarks.landmarks and (loaded.bwd == g._landmarks.bwd).all(), "Landmarks did not load"
+    finally:
+        os.remove(path)
+    assert search(h, 0, 5) == dijkstra(h, 0, 5), "Loaded landmarks search differs"
+    assert not g.indexed, "Preprocessing indexed the graph"
+    frozen = g.freeze()
+    one, two = Landmarks.build(g, 4, seed=1), preprocess(frozen, 4, seed=1)
+    assert (one.fwd == two.fwd).all() and (one.bwd == two.bwd).all(), "Frozen landmark tables differ"
+    assert search(frozen, 0, 5) == dijkstra(g, 0, 5), "Frozen landmarks search differs"
+    h.add_edge(0, 5, 1)
+    assert h._landmarks.stale and search(h, 0, 5) == (1, [0, 5]), "Stale landmarks were used"
+
+@testcase
+def test_6():
+    sizes = [10**3, 10**4, 2*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        timer(preprocess)(g, 8)
+        print("Landmark tables: %s bytes" % g._landmarks.nbytes)
+        pairs = [(random.randint(0, s-1), random.randint(0, s-1)) for i in range(20)]
+        plain, guided = 0, 0
+        for (u, v) in pairs:
+            one, two = {}, {}
+            cost = dijkstra(g, u, v, stats=one)[0]
+            assert search(g, u, v, stats=two)[0] == cost, "A* cost differs"
+            plain, guided = plain + one['settled'], guided + two['settled']
+        print("Settled %s nodes with dijkstra, %s with ALT" % (plain, guided), level=1)
+
+@testcase
+def test_7():
+    sizes = [10**3, 10**4, 4*10**4]
+    for s in (sizes):
+        for hi in (10, s):
+            random.seed(10)
+            g = TimeableGraph.generate(s, 10*s, weight_range=(1, hi))
+            u = random.randint(0,50)
+            print("Weights up to %s pick the %s frontier" % (hi, pick_frontier(g)), level=1)
+            results = [dijkstra(g, u, frontier=f)[0] for f in ('heap', 'dial', 'radix', 'indexed')]
+            assert all(r == results[0] for r in results), "Frontiers disagree"
+    g = Graph.generate(50, 200, weight_range=(1, 5))
+    g.add_edge(0, 1, 2.5)
+    assert pick_frontier(g) == 'heap', "Float weights went to a bucket queue"
+
+@testcase
+def test_8():
+    random.seed(9)
+    g = Graph.generate(100, 400, weight_range=(1, 20))
+    for u in range(0, 100, 11):
+        costs, prevs = dijkstra(g, u)
+        order = list(iter_dijkstra(g, u))
+        reached = sorted(v for v in g.vertices if costs[v] < float('inf'))
+        assert sorted(node for (node, cost, prev) in order) == reached, "Wrong vertices settled"
+        assert all(cost == costs[node] for (node, cost, prev) in order), "Wrong settle cost"
+        assert all(a[1] <= b[1] for (a, b) in zip(order, order[1:])), "Costs decreased"
+        assert all(costs[p[1]] + p[0] == cost for (node, cost, p) in order[1:]), "Wrong prev"
+        near = nearest(g, u, 5)
+        assert [c for (v, c) in near] == sorted(costs[v] for v in reached if v != u)[:5], "Wrong k nearest"
+        radius = sorted(costs[v] for v in reached)[len(reached) // 3]
+        assert sorted(v for (v, c) in within(g, u, radius)) == \
+               sorted(v for v in reached if costs[v] <= radius), "Wrong vertices within radius"
+        cost, path = find_first(g, u, lambda v: v % 7 == 3)
+        best = min([costs[v] for v in reached if v % 7 == 3] or [0])
+        assert cost == best, "Wrong first match"
+        if path is not None:
+            assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    assert find_first(g, 0, lambda v: False) == (0, None), "Found a vertex that DNE"
+
+@timer
+def nearest_10(g, sources):
+    return [nearest(g, u, 10) for u in sources]
+
+@timer
+def full_dijkstra(g, sources):
+    return [dijkstra(g, u) for u in sources]
+
+@testcase
+def test_9():
+    sizes = [10**3, 10**4, 4*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        sources = random.sample(range(s), 10)
+        near = nearest_10(g, sources)
+        full = full_dijkstra(g, sources)
+        for (found, (costs, prevs)) in zip(near, full):
+            assert [c for (v, c) in found] == sorted(c for c in costs.itervalues() if c < float('inf'))[1:11], "k nearest costs differ"
+
+@testcase
+def test_10():
+    random.seed(4)
+    g = Graph.generate(60, 240, weight_range=(1, 50))
+    expected = dijkstra(g, 0, frontier='heap')
+    g._weight_span = (g.version, (0, 1, True)) # a span the weights have outgrown
+    assert pick_frontier(g) == 'dial', "Span was recomputed"
+    assert dijkstra(g, 0) == expected, "Dial bucketed an out of range weight"
+    for frontier in ('dial', 'radix'):
+        h = Graph(range(3))
+        h.add_edges_from([(0, 1, 2.5), (1, 2, 1)])
+        h._weight_span = (h.version, (0, 3, True))
+        try:
+            dijkstra(h, 0, frontier=frontier)
+        except ValueError:
+            continue
+        assert False, "The %s frontier took a float weight" % frontier
 
 if __name__ == '__main__':
     # test()
     # test_2()
-    call_tests([1], verbose=False)
+    call_tests([1, 2, 3, 4, 5, 6, 7, 8, 9], verbose=False)
     show_stack()
\ No newline at end of file
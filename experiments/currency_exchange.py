@@ -10,6 +10,7 @@ from heapq import *
 import init
 from Graph import *
 from utils import *
+from bf import find_negative_cycle
 from experiments.queue import PriorityQueue
 
 DATA_FILE = "currencies.csv"
@@ -58,6 +59,20 @@ def ck_bellman_ford(g, start, k=0):
             # print("Graph contains a negative-weight cycle"); break
     return (costs, prevs)
 
+def find_arbitrage(g):
+    """
+    A loop of trades that ends with more than it started, as (cycle, rate
+    of return), or None. Rates multiply along a path, so with every rate w
+    costing -log10(w) such a loop is a negative cycle, and
+    find_negative_cycle stops as soon as one shows up in its search
+    """
+    costs = Graph({u: {v: -log10(w) for (v, w) in g[u].edges.iteritems()} for u in g.vertices})
+    found = find_negative_cycle(costs)
+    if found is None:
+        return None
+    cycle, weight = found
+    return (cycle, 10**(-weight))
+
 def main():
     g = make_graph()
     g.display()
@@ -69,6 +84,7 @@ def main():
     cost, path = get_path(prevs, v, u)
     print(10**(-cost))
     print(path)
+    print("Arbitrage: %s" % (find_arbitrage(g),))
 
 if __name__ == '__main__':
     main()
@@ -7,23 +7,36 @@ import init
 from TimeUtils import *
 
 class PriorityQueue(object):
-    NULL = '<null-item>' # placeholder for a removed item
-    def __init__(self, items=[], maxheap=False):
+    """Indexed d-ary heap of [priority, count, item] entries.
+    position tracks where every item's entry sits in the heap, so updating
+    an item moves its entry in place (O(log_d n)) instead of leaving a dead
+    entry behind, and the heap never holds more entries than items.
+    count breaks ties in insertion order"""
+    def __init__(self, items=[], maxheap=False, arity=4):
         self._maxheap = maxheap # whether to return lowest value on pop
-        self.heap = []   # list of items arranged in a heap
-        self.mapping = OD() # mapping of items to heap
+        self.arity = arity
+        self.heap = []   # list of entries arranged in a heap
+        self.mapping = OD() # mapping of items to entries
+        self.position = {} # index of every item's entry in heap
         self.counter = itertools.count() # unique sequence count
         if isinstance(items, Mapping):
-            [ self.insert(k,v) for (k,v) in items.iteritems() ]
+            pairs = items.iteritems()
         else:
-            [ self.insert(k) for (k) in items]
+            pairs = ((k, 0) for k in items)
+        for (k, v) in pairs:
+            if k in self.mapping:
+                self.mapping[k][0] = self.weight * v
+            else:
+                self.mapping[k] = [self.weight * v, next(self.counter), k]
+        self.heap = self.mapping.values()
+        self.heapify()
     @property
     def weight(self):
         """Allows for max heap to flip signs"""
         return (1-2*int(self._maxheap))
     @property
     def items(self):
-        return [ self[k][-1] for (p,c,k) in self.heap if k is not self.NULL ]
+        return [ entry[-1] for entry in self.heap ]
     def __repr__(self):
         return repr(self.items)
     def __len__(self):
@@ -34,28 +47,149 @@ class PriorityQueue(object):
         return self.mapping[key]
     def __setitem__(self, key, value):
         self.insert(key, value)
+    def heapify(self):
+        'Arranges heap bottom-up in O(n)'
+        self.position = {entry[-1]: i for (i, entry) in enumerate(self.heap)}
+        for i in reversed(xrange((len(self.heap) - 2) // self.arity + 1)):
+            self._sift_down(i)
+    def _place(self, entry, i):
+        self.heap[i] = entry
+        self.position[entry[-1]] = i
+    def _sift_up(self, i):
+        heap, d = self.heap, self.arity
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) // d
+            if heap[parent] <= entry:
+                break
+            self._place(heap[parent], i)
+            i = parent
+        self._place(entry, i)
+    def _sift_down(self, i):
+        heap, d, n = self.heap, self.arity, len(self.heap)
+        entry = heap[i]
+        while True:
+            first = d * i + 1
+            if first >= n:
+                break
+            child = min(xrange(first, min(first + d, n)), key=heap.__getitem__)
+            if entry <= heap[child]:
+                break
+            self._place(heap[child], i)
+            i = child
+        self._place(entry, i)
     def insert(self, item, priority=0):
         'Add a new item or update the priority of an existing item'
         priority = self.weight * priority
-        if item in self.mapping:
-            self.remove(item)
         count = next(self.counter)
+        if item in self.mapping:
+            entry = self.mapping[item]
+            entry[0], entry[1] = priority, count
+            i = self.position[item]
+            self._sift_up(i)
+            self._sift_down(self.position[item])
+            return
         entry = [priority, count, item]
         self.mapping[item] = entry
-        heappush(self.heap, entry)
+        self.heap.append(entry)
+        self._sift_up(len(self.heap) - 1)
+    def decrease_key(self, item, priority):
+        'Move an existing item towards the front. Raise ValueError otherwise'
+        entry = self.mapping[item]
+        if self.weight * priority > entry[0]:
+            raise ValueError('%s would move %s back in the queue' % (priority, item))
+        entry[0], entry[1] = self.weight * priority, next(self.counter)
+        self._sift_up(self.position[item])
+    def push(self, priority, item):
+        'Frontier interface for dk.dijkstra, inserts or updates item'
+        self.insert(item, priority)
     def remove(self, item):
-        'Mark an existing item as NULL.  Raise KeyError if not found.'
+        'Remove an existing item.  Raise KeyError if not found.'
         entry = self.mapping.pop(item)
-        entry[-1] = self.NULL
+        i = self.position.pop(item)
+        last = self.heap.pop()
+        if last is not entry:
+            self._place(last, i)
+            self._sift_up(i)
+            self._sift_down(self.position[last[-1]])
     def pop(self):
         'Remove and return the lowest priority item. Raise KeyError if empty.'
-        while self.heap:
-            priority, count, item = heappop(self.heap)
-            priority = self.weight * priority
-            if item is not self.NULL:
-                del self.mapping[item]
-                return (priority, item)
-        raise KeyError('pop from an empty priority queue')
+        if not self.heap:
+            raise KeyError('pop from an empty priority queue')
+        priority, count, item = self.heap[0]
+        self.remove(item)
+        return (self.weight * priority, item)
+
+class HeapFrontier(list):
+    """Binary heap of (priority, item) pairs, the default Dijkstra frontier"""
+    def push(self, priority, item):
+        heappush(self, (priority, item))
+    def pop(self):
+        return heappop(self)
+
+class DialFrontier(object):
+    """Dial's circular bucket queue for monotone integer priorities.
+    Pending priorities lie within max_weight of the last pop, so with
+    max_weight+1 buckets every bucket holds a single priority and push is
+    a list append. pop scans forward to the next non-empty bucket.
+    push raises ValueError for a priority outside that window or not an int,
+    which would otherwise land in the wrong bucket"""
+    def __init__(self, max_weight):
+        self.buckets = [[] for i in xrange(max_weight+1)]
+        self.cur = 0
+        self.size = 0
+    def __len__(self):
+        return self.size
+    def push(self, priority, item):
+        n = len(self.buckets)
+        if type(priority) not in (int, long) or not 0 <= priority - self.cur < n:
+            raise ValueError("Priority %s is outside Dial's window [%s, %s]" % (priority, self.cur, self.cur + n - 1))
+        self.buckets[priority % n].append(item)
+        self.size += 1
+    def pop(self):
+        if not self.size:
+            raise KeyError('pop from an empty frontier')
+        buckets, n = self.buckets, len(self.buckets)
+        while not buckets[self.cur % n]:
+            self.cur += 1
+        self.size -= 1
+        return (self.cur, buckets[self.cur % n].pop())
+
+class RadixHeap(object):
+    """Radix heap for monotone non-negative integer priorities.
+    Entries sit in the bucket of the highest bit where they differ from
+    the last popped priority. Popping from an empty bucket 0 moves the
+    smallest entries of the first non-empty bucket down, and each entry
+    only ever moves to lower buckets, O(log C) times in total.
+    push raises ValueError for a priority below the last pop or not an int"""
+    def __init__(self):
+        self.buckets = [[]]
+        self.last = 0
+        self.size = 0
+    def __len__(self):
+        return self.size
+    def push(self, priority, item):
+        if type(priority) not in (int, long) or priority < self.last:
+            raise ValueError("Priority %s is below the radix heap's last pop %s" % (priority, self.last))
+        b = (priority ^ self.last).bit_length()
+        while b >= len(self.buckets):
+            self.buckets.append([])
+        self.buckets[b].append((priority, item))
+        self.size += 1
+    def pop(self):
+        if not self.size:
+            raise KeyError('pop from an empty frontier')
+        buckets = self.buckets
+        if not buckets[0]:
+            i = 1
+            while not buckets[i]:
+                i += 1
+            entries, buckets[i] = buckets[i], []
+            last = self.last = min(entries)[0]
+            for entry in entries:
+                buckets[(entry[0] ^ last).bit_length()].append(entry)
+        self.size -= 1
+        return buckets[0].pop()
 
 def bisect_left(a, x, lo=0, hi=None, key=None):
     if lo < 0:
@@ -147,6 +281,46 @@ def test_max_priority_queue():
     assert el == 1 and p == 0, "q did not pop correctly"
     print "Success"
 
+def test_decrease_key():
+    import random
+    random.seed(3)
+    q = PriorityQueue({i: random.randint(0, 1000) for i in range(500)}, arity=3)
+    for i in range(2000):
+        k = random.randint(0, 499)
+        if k in q and random.random() < 0.5:
+            q.decrease_key(k, q[k][0] - random.randint(0, 50))
+        else:
+            q[k] = random.randint(0, 1000)
+        assert len(q.heap) == len(q.mapping), "heap grew past its items"
+    popped = [q.pop() for i in range(len(q))]
+    assert popped == sorted(popped, key=lambda (p, k): p), "q did not pop in order"
+    assert not q.heap and not q.position, "q did not empty"
+    try:
+        q[1] = 5
+        q.decrease_key(1, 6)
+    except ValueError:
+        print "Success"
+    else:
+        raise AssertionError("decrease_key moved an item back")
+
+def test_frontiers():
+    import random
+    random.seed(2)
+    for (frontier, hi) in ((HeapFrontier(), 10**6), (DialFrontier(50), 50), (RadixHeap(), 10**9), (PriorityQueue(), 10**6)):
+        cur, popped = 0, []
+        frontier.push(0, 'start')
+        pushed = 1
+        while frontier:
+            (priority, item) = frontier.pop()
+            assert priority >= cur, "%s popped out of order" % type(frontier).__name__
+            cur = priority
+            popped.append(priority)
+            while pushed < 2000 and random.random() < 0.7:
+                frontier.push(cur + random.randint(0, hi), pushed)
+                pushed += 1
+        assert len(popped) == pushed, "%s lost items" % type(frontier).__name__
+    print "Success"
+
 def test_perf(size=10**4):
     q = deque(range(size))
     @timer
@@ -184,5 +358,7 @@ if __name__ == '__main__':
     benchmark_queue = testcase(benchmark_queue)
     test_priority_queue = testcase(test_priority_queue)
     test_max_priority_queue = testcase(test_max_priority_queue)
-    call_tests([3, 4], verbose=False)
+    test_frontiers = testcase(test_frontiers)
+    test_decrease_key = testcase(test_decrease_key)
+    call_tests([3, 4, 5, 6], verbose=False)
     show_stack()
\ No newline at end of file
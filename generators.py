@@ -0,0 +1,143 @@
+"""
+Random G(n, m) edge samplers behind Graph.generate and Graph.generate_DAG.
+Acyclic graphs are made by drawing a random permutation of the vertices and
+only ever pointing edges from earlier to later positions in it, so no
+candidate edge is ever checked against the graph or rejected for a cycle.
+"""
+from __future__ import print_function
+import random
+from itertools import izip
+
+from TimeUtils import *
+
+def max_edges(v, allow_cycles=True):
+    """Number of distinct edges without self loops on v vertices"""
+    return v * (v-1) if allow_cycles else v * (v-1) // 2
+
+def check_size(v, e, allow_cycles=True):
+    if e > max_edges(v, allow_cycles):
+        raise ValueError("Cannot place %s edges on %s vertices%s" %
+            (e, v, "" if allow_cycles else " without cycles"))
+
+def sample_edges(v, e, allow_cycles=True, weight_range=(1,1), seed=None):
+    """Pure python sampler yielding e distinct (u, v, w) edges.
+    With seed=None the global random module is used, so random.seed
+    still makes the output reproducible"""
+    check_size(v, e, allow_cycles)
+    rand = random.Random(seed) if seed is not None else random
+    order = list(range(v))
+    rand.shuffle(order)
+    seen = set()
+    while len(seen) < e:
+        x, y = rand.randint(0, v-1), rand.randint(0, v-1)
+        if x == y:
+            continue
+        if not allow_cycles and x > y:
+            x, y = y, x
+        if (x, y) in seen:
+            continue
+        seen.add((x, y))
+        w = rand.randint(*weight_range)
+        yield (order[x], order[y], w) if not allow_cycles else (x, y, w)
+
+def gnm(v, e, allow_cycles=True, weight_range=(1,1), seed=None):
+    """Vectorized sampler returning (src, dst, weights) int64 arrays of e
+    distinct edges. Candidates are drawn in bulk, encoded as src*v+dst and
+    deduplicated with np.unique until enough survive.
+    With seed=None the seed is drawn from the global random module"""
+    import numpy as np
+    check_size(v, e, allow_cycles)
+    seed = random.getrandbits(32) if seed is None else seed
+    rng = np.random.RandomState(seed)
+    order = rng.permutation(v)
+    keys = np.empty(0, dtype=np.int64)
+    while len(keys) < e:
+        batch = int(1.1 * (e - len(keys))) + 16
+        a = rng.randint(0, v, batch).astype(np.int64)
+        b = rng.randint(0, v, batch).astype(np.int64)
+        keep = a != b
+        a, b = a[keep], b[keep]
+        if not allow_cycles:
+            a, b = np.minimum(a, b), np.maximum(a, b)
+        keys = np.unique(np.concatenate((keys, a * v + b)))
+    if len(keys) > e:
+        keys = rng.choice(keys, e, replace=False)
+    else:
+        rng.shuffle(keys)
+    src, dst = keys // v, keys % v
+    if not allow_cycles:
+        src, dst = order[src], order[dst]
+    low, hi = weight_range
+    weights = rng.randint(low, hi+1, e).astype(np.int64)
+    return (src, dst, weights)
+
+def random_edges(v, e, allow_cycles=True, weight_range=(1,1), seed=None):
+    """Iterates (u, v, w) with python ints, vectorized when numpy is around"""
+    try:
+        import numpy
+    except ImportError:
+        return sample_edges(v, e, allow_cycles, weight_range, seed)
+    src, dst, weights = gnm(v, e, allow_cycles, weight_range, seed)
+    return izip(src.tolist(), dst.tolist(), weights.tolist())
+
+def grid_edges(rows, cols, weight_range=(1,1), seed=None):
+    """Yields (u, v, w) for a rows x cols grid with edges both ways between
+    neighbouring cells, the same weight in each direction. Cell (r, c) is
+    vertex r*cols + c. A stand-in for road networks, which unlike G(n, m)
+    graphs have a hierarchy that contraction can exploit"""
+    rand = random.Random(seed) if seed is not None else random
+    for r in xrange(rows):
+        for c in xrange(cols):
+            u = r*cols + c
+            for v in ((u+1) if c+1 < cols else None, (u+cols) if r+1 < rows else None):
+                if v is not None:
+                    w = rand.randint(*weight_range)
+                    yield (u, v, w)
+                    yield (v, u, w)
+
+def test_gnm():
+    for allow_cycles in (True, False):
+        edges = list(random_edges(50, 400, allow_cycles, (1, 9), seed=7))
+        assert edges == list(random_edges(50, 400, allow_cycles, (1, 9), seed=7)), "Seeded output changed"
+        assert len(set((u, v) for (u, v, w) in edges)) == 400, "Duplicate edges"
+        assert all(u != v and 1 <= w <= 9 for (u, v, w) in edges), "Bad edge"
+    edges = list(sample_edges(50, 400, seed=7))
+    assert len(set((u, v) for (u, v, w) in edges)) == 400, "Duplicate python edges"
+    try:
+        list(random_edges(4, 7, allow_cycles=False))
+    except ValueError as err:
+        print(err)
+    else:
+        raise AssertionError("Too many DAG edges were accepted")
+
+def test_dag():
+    from collections import Counter
+    for edges in (sample_edges, random_edges):
+        out = {i: [] for i in range(200)}
+        indegrees = Counter()
+        for (u, v, w) in edges(200, 2000, allow_cycles=False, seed=3):
+            out[u].append(v)
+            indegrees[v] += 1
+        sources = [v for v in out if not indegrees[v]]
+        visited = 0
+        while sources:
+            visited += 1
+            for v in out[sources.pop()]:
+                indegrees[v] -= 1
+                if not indegrees[v]:
+                    sources.append(v)
+        assert visited == 200, "DAG has a cycle"
+
+def test_dag_2():
+    from Graph import TimeableGraph
+    sizes = [10**3, 10**4, 10**5]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, allow_cycles=False)
+
+if __name__ == '__main__':
+    test_gnm = testcase(test_gnm)
+    test_dag = testcase(test_dag)
+    test_dag_2 = testcase(test_dag_2)
+    call_tests(verbose=False)
+    show_stack()
@@ -0,0 +1,218 @@
+"""
+Streams edge lists into graphs in fixed size batches.
+A source is a path, an open file or any iterable of lines or (u, v[, w])
+tuples. Columns are parsed a batch at a time with numpy, so peak memory is
+the graph being built plus one batch, never an intermediate dict-of-dicts.
+"""
+from __future__ import print_function
+import os
+import random
+import tempfile
+from itertools import islice, izip, chain
+import numpy as np
+
+from Graph import *
+from generators import gnm
+from TimeUtils import *
+from utils import *
+
+BATCH_SIZE = 10**5
+INT_CHARS = '0123456789-+ \t\r\n'
+
+def as_ints(tokens):
+    """int64 column of ints or int strings, None for anything else"""
+    col = np.asarray(tokens)
+    if col.dtype.kind in 'iu':
+        return col.astype(np.int64, copy=False)
+    if col.dtype.kind in 'SU':
+        try:
+            return col.astype(np.int64)
+        except ValueError:
+            pass
+    return None
+
+def parse_weights(tokens):
+    col = as_ints(tokens)
+    return col if col is not None else np.array(tokens).astype(np.float64)
+
+def split_lines(lines, sep, comment):
+    """Splits a batch of lines into columns. When every line has the same
+    width the joined text is split in a single call, otherwise (comments,
+    blanks, ragged rows) each line is split on its own"""
+    text = ''.join(lines)
+    if comment not in text and (sep is None or ' ' not in text):
+        width = len(lines[0].split(sep))
+        if not text.translate(None, INT_CHARS + (sep or '')):
+            # only integers, let numpy parse the whole batch in C
+            flat = np.fromstring(text if sep is None else text.replace(sep, ' '),
+                                 dtype=np.int64, sep=' ')
+            if len(flat) == width * len(lines):
+                return [flat[i::width] for i in xrange(width)]
+        if sep is None:
+            tokens = text.split()
+        else:
+            tokens = text.replace('\r', '').replace('\n', sep).split(sep)
+            if tokens and not tokens[-1]:
+                tokens.pop()
+        if len(tokens) == width * len(lines):
+            return [tokens[i::width] for i in xrange(width)]
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith(comment):
+            rows.append([t.strip() for t in line.split(sep)])
+    return to_columns(rows)
+
+def to_columns(rows):
+    """Transposes rows, giving (u, v) rows the default weight of 1"""
+    if len(set(len(r) for r in rows)) > 1:
+        rows = [tuple(r) + (1,) if len(r) == 2 else r for r in rows]
+    return zip(*rows)
+
+def read_batches(source, sep=None, comment='#', skip_header=False,
+                 int_names=None, batch_size=BATCH_SIZE):
+    """Yields (us, vs, ws) numpy columns batch_size rows at a time.
+    sep=None splits on whitespace, use ',' or '\\t' for CSV and TSV.
+    Rows without a third column get weight 1. int_names=None decides from
+    the first batch whether vertex names are ints"""
+    if isinstance(source, basestring):
+        with open(source) as infile:
+            for batch in read_batches(infile, sep, comment, skip_header, int_names, batch_size):
+                yield batch
+        return
+    rows = iter(source)
+    first = next(rows, None)
+    if first is None:
+        return
+    rows = chain([first], rows)
+    lines = isinstance(first, basestring)
+    if lines and skip_header:
+        next(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        cols = split_lines(batch, sep, comment) if lines else to_columns(batch)
+        if not cols:
+            continue
+        ints = [as_ints(col) for col in cols[:2]] if int_names is not False else []
+        if int_names is None:
+            int_names = all(col is not None for col in ints)
+        if not int_names:
+            us, vs = np.array(cols[0], dtype=object), np.array(cols[1], dtype=object)
+        elif any(col is None for col in ints):
+            raise ValueError("Vertex names are not all ints, pass int_names=False")
+        else:
+            us, vs = ints
+        ws = parse_weights(cols[2]) if len(cols) > 2 else np.ones(len(us), dtype=np.int64)
+        yield (us, vs, ws)
+
+def load_graph(source, cls=Graph, frozen=False, **kwargs):
+    """Builds a cls graph from an edge list source, creating vertices as
+    they appear. Repeated edges keep the last weight, as with add_edge.
+    With frozen the edges go straight into a FrozenGraph's CSR arrays
+    instead of Vertex dictionaries. kwargs are passed to read_batches"""
+    if frozen:
+        return load_frozen(source, cls, **kwargs)
+    graph = cls()
+    vertices = graph.vertices
+    with PausedGC():
+        for (us, vs, ws) in read_batches(source, **kwargs):
+            for name in np.unique(np.concatenate((us, vs))).tolist():
+                if name not in vertices:
+                    graph.add_vertex(name)
+            graph.add_edges_from(izip(us.tolist(), vs.tolist(), ws.tolist()))
+    return graph
+
+def load_frozen(source, cls=Graph, **kwargs):
+    """Maps names to indices a batch at a time and sorts the collected
+    (src, dst, w) columns into CSR order once at the end"""
+    from csr import FrozenGraph, is_range
+    index, names = {}, []
+    srcs, dsts, wts = [], [], []
+    for (us, vs, ws) in read_batches(source, **kwargs):
+        uniq, inv = np.unique(np.concatenate((us, vs)), return_inverse=True)
+        for name in uniq.tolist():
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+        ids = np.array([index[name] for name in uniq.tolist()], dtype=np.int64)[inv]
+        srcs.append(ids[:len(us)])
+        dsts.append(ids[len(us):])
+        wts.append(ws)
+    n = len(names)
+    src = np.concatenate(srcs) if srcs else np.empty(0, dtype=np.int64)
+    dst = np.concatenate(dsts) if dsts else np.empty(0, dtype=np.int64)
+    w = np.concatenate(wts) if wts else np.empty(0, dtype=np.int64)
+    del srcs, dsts, wts
+    keys = src * n + dst
+    if (np.diff(np.sort(keys)) == 0).any():
+        # a repeated edge keeps its first position and its last weight
+        uniq, first = np.unique(keys, return_index=True)
+        _, rlast = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - rlast
+        del uniq, rlast
+        byfirst = np.argsort(first)
+        first, last = first[byfirst], last[byfirst]
+    else:
+        first = last = np.arange(len(keys))
+    del keys
+    # a stable sort by source keeps each row in insertion order
+    rows = np.argsort(src[first], kind='mergesort')
+    order, last = first[rows], last[rows]
+    targets, weights = dst[order], w[last]
+    offsets = np.zeros(n+1, dtype=np.int64)
+    np.cumsum(np.bincount(src[order], minlength=n), out=offsets[1:])
+    if is_range(names):
+        names = xrange(n)
+    return FrozenGraph(names, offsets, targets, weights, source_cls=cls)
+
+def test_load():
+    g = Graph.generate(40, 200, weight_range=(1, 9), seed=5)
+    edges = g.edgelist
+    sources = {
+        "ws": ["# u v w\n"] + ["%s %s %s\n" % (u, v, w) for ((u, v), w) in edges],
+        "csv": ["u,v,w\n"] + ["%s,%s,%s\n" % (u, v, w) for ((u, v), w) in edges],
+        "tuples": [(u, v, w) for ((u, v), w) in edges],
+    }
+    options = {"ws": {}, "csv": {"sep": ",", "skip_header": True}, "tuples": {}}
+    expected = sorted(edges)
+    for (kind, lines) in sources.iteritems():
+        (fd, path) = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w") as outfile:
+            outfile.writelines(l if isinstance(l, str) else "%s %s %s\n" % l for l in lines)
+        try:
+            for source in (lines, path):
+                if kind == "tuples" and source is path:
+                    continue
+                for frozen in (False, True):
+                    h = load_graph(source, frozen=frozen, batch_size=37, **options[kind])
+                    assert sorted(h.edgelist) == expected, "%s load differs (frozen=%s)" % (kind, frozen)
+        finally:
+            os.remove(path)
+    h = load_graph([("a", "b"), ("b", "c", 2.5), ("a", "b", 4)])
+    f = load_graph([("a", "b"), ("b", "c", 2.5), ("a", "b", 4)], frozen=True)
+    assert h.adjacency_map == f.adjacency_map == {"a": {"b": 4}, "b": {"c": 2.5}, "c": {}}, "Named load failed"
+
+@timer
+def write_edges(path, s):
+    src, dst, w = gnm(s, 10*s, weight_range=(1, s), seed=10)
+    np.savetxt(path, np.column_stack((src, dst, w)), fmt="%d")
+
+def test_load_2():
+    sizes = [10**3, 10**4, 10**5]
+    (fd, path) = tempfile.mkstemp(suffix=".txt")
+    os.close(fd)
+    try:
+        for s in (sizes):
+            write_edges(path, s)
+            timer(load_graph)(path)
+            timer(load_frozen)(path)
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    test_load = testcase(test_load)
+    test_load_2 = testcase(test_load_2)
+    call_tests(verbose=False)
+    show_stack()
@@ -0,0 +1,278 @@
+"""
+Reachability indices answering "is there a path u -> v" without a fresh DFS.
+Every mode first condenses the graph by its strongly connected components
+(scc.tarjan_iter), so vertices in one component answer at once and the rest
+of the work happens on the condensation DAG.
+    closure        transitive closure of the DAG as packed numpy bitsets, O(1)
+                   queries in c^2/8 bytes for c components
+    interval       GRAIL-style [low, high] labels from k random DFS orders,
+                   plus the first DFS tree as a tree cover. Labels refute most
+                   queries and confirm tree descendants, the rest run a DFS
+                   pruned by the labels. O(k*c) memory, for large DAGs
+    condensation   just the component map and DAG, queries DFS over the DAG
+"""
+from __future__ import print_function
+import random
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+from scc import tarjan_iter
+
+CLOSURE_LIMIT = 2 * 10**4 # most components the auto mode keeps a closure for
+TRAVERSALS = 3 # random DFS orders labelled in interval mode
+
+class Condensation(object):
+    """Component id of every vertex and the DAG between components.
+    Ids follow tarjan's output order, so every DAG edge points to a lower id"""
+    def __init__(self, g):
+        self.comp = {}
+        components = tarjan_iter(g)
+        for (cid, members) in enumerate(components.itervalues()):
+            for name in members:
+                self.comp[name] = cid
+        self.size = len(components)
+        self.dag = [set() for i in xrange(self.size)]
+        self.rdag = [set() for i in xrange(self.size)]
+        for v in g.vertices.itervalues():
+            cu = self.comp[v.name]
+            for t in v.edges:
+                cv = self.comp[t]
+                if cu != cv:
+                    self.dag[cu].add(cv)
+                    self.rdag[cv].add(cu)
+    def add_edge(self, cu, cv):
+        self.dag[cu].add(cv)
+        self.rdag[cv].add(cu)
+
+class ReachabilityIndex(object):
+    """Answers reaches(u, v) for graph g in the given mode (see the module
+    docstring), 'auto' picks closure up to CLOSURE_LIMIT components and
+    interval above. add_edge updates the index in place; any other change
+    to g is noticed through g.version and rebuilds it on the next query"""
+    def __init__(self, g, mode='auto'):
+        self._g = g
+        self._mode = mode
+        self.build()
+    @property
+    def mode(self):
+        return self._built_mode
+    @property
+    def stale(self):
+        return self._g.version != self._version
+    def build(self):
+        self._version = self._g.version
+        self._cond = Condensation(self._g)
+        mode = self._mode
+        if mode == 'auto':
+            mode = 'closure' if self._cond.size <= CLOSURE_LIMIT else 'interval'
+        self._built_mode = mode
+        if mode == 'closure':
+            self._build_closure()
+        elif mode == 'interval':
+            self._build_interval()
+        elif mode != 'condensation':
+            raise ValueError("Unknown reachability mode %s" % mode)
+    @property
+    def nbytes(self):
+        """Bytes held by the closure bitsets or the interval labels"""
+        if self._built_mode == 'closure':
+            return self._bits.nbytes
+        if self._built_mode == 'interval':
+            return deep_sizeof((self._low, self._high, self._tree_low, self._rank))
+        return 0
+    def _build_closure(self):
+        import numpy as np
+        c = self._cond.size
+        self._bits = np.zeros((c, (c + 7) // 8), dtype=np.uint8)
+        for cu in xrange(c): # successors always have lower ids, so are done
+            succ = self._cond.dag[cu]
+            if succ:
+                self._bits[cu] = np.bitwise_or.reduce(self._bits[list(succ)], axis=0)
+            self._bits[cu, cu >> 3] |= 1 << (cu & 7)
+    def _build_interval(self):
+        c = self._cond.size
+        dag = self._cond.dag
+        self._low, self._high = [], []
+        self._tree_low = [0] * c
+        for k in xrange(TRAVERSALS):
+            rank = [0] * c
+            low = [0] * c
+            visited = [False] * c
+            roots = range(c)
+            random.shuffle(roots)
+            post = 0
+            for root in roots:
+                if visited[root]:
+                    continue
+                visited[root] = True
+                work = [(root, iter(random.sample(dag[root], len(dag[root]))))]
+                start = [post]
+                while work:
+                    x, children = work[-1]
+                    for y in children:
+                        if not visited[y]:
+                            visited[y] = True
+                            work.append((y, iter(random.sample(dag[y], len(dag[y])))))
+                            start.append(post)
+                            break
+                    else:
+                        work.pop()
+                        first = start.pop()
+                        rank[x] = post
+                        low[x] = min([post] + [low[y] for y in dag[x]])
+                        if k == 0:
+                            # DFS subtree of x holds exactly the ranks first..post
+                            self._tree_low[x] = first
+                        post += 1
+            if k == 0:
+                self._rank = rank
+            self._low.append(low)
+            self._high.append(list(rank))
+    def _contains(self, cu, cv):
+        """False means cu cannot reach cv"""
+        for (low, high) in zip(self._low, self._high):
+            if low[cv] < low[cu] or high[cv] > high[cu]:
+                return False
+        return True
+    def _reaches_interval(self, cu, cv):
+        rank, tree_low = self._rank, self._tree_low
+        fringe = [cu]
+        seen = {cu}
+        while fringe:
+            x = fringe.pop()
+            if x == cv or tree_low[x] <= rank[cv] <= rank[x]:
+                return True
+            for y in self._cond.dag[x]:
+                if y not in seen and self._contains(y, cv):
+                    seen.add(y)
+                    fringe.append(y)
+        return False
+    def _reaches_dag(self, cu, cv):
+        fringe = [cu]
+        seen = {cu}
+        while fringe:
+            x = fringe.pop()
+            if x == cv:
+                return True
+            for y in self._cond.dag[x]:
+                if y not in seen and y >= cv: # ids only drop along DAG edges
+                    seen.add(y)
+                    fringe.append(y)
+        return False
+    def _reaches(self, cu, cv):
+        if cu == cv:
+            return True
+        if cv > cu: # ids only drop along DAG edges
+            return False
+        if self._built_mode == 'closure':
+            return bool(self._bits[cu, cv >> 3] >> (cv & 7) & 1)
+        if self._built_mode == 'interval':
+            return self._contains(cu, cv) and self._reaches_interval(cu, cv)
+        return self._reaches_dag(cu, cv)
+    def reaches(self, u, v):
+        """Whether v can be reached from u (always true for u == v)"""
+        if self.stale:
+            self.build()
+        comp = self._cond.comp
+        return self._reaches(comp[u], comp[v])
+    def add_edge(self, u, v, w=1):
+        """Adds u->v to the graph and folds it into the index. An edge that
+        closes a cycle or runs against the component order rebuilds the index"""
+        self._g.add_edge(u, v, w)
+        if self._g.version != self._version + 1:
+            self.build() # the graph also changed elsewhere
+            return
+        self._version = self._g.version
+        comp = self._cond.comp
+        cu, cv = comp[u], comp[v]
+        if self._reaches(cu, cv):
+            return
+        if self._reaches(cv, cu) or cv > cu:
+            self.build()
+            return
+        self._cond.add_edge(cu, cv)
+        if self._built_mode == 'closure':
+            import numpy as np
+            bits = self._bits
+            rows = np.nonzero(bits[:, cu >> 3] >> (cu & 7) & 1)[0]
+            bits[rows] |= bits[cv]
+        elif self._built_mode == 'interval':
+            self._widen(cu, cv)
+    def _widen(self, cu, cv):
+        """Grows the labels of cu and its ancestors to cover cv's, stopping
+        wherever a label already covers it since its ancestors then do too"""
+        fringe = [cu]
+        seen = {cu}
+        while fringe:
+            x = fringe.pop()
+            changed = False
+            for (low, high) in zip(self._low, self._high):
+                if low[cv] < low[x] or high[cv] > high[x]:
+                    low[x] = min(low[x], low[cv])
+                    high[x] = max(high[x], high[cv])
+                    changed = True
+            if changed:
+                for y in self._cond.rdag[x]:
+                    if y not in seen:
+                        seen.add(y)
+                        fringe.append(y)
+
+def test_reach():
+    random.seed(6)
+    for allow_cycles in (True, False):
+        g = Graph.generate(80, 160, allow_cycles=allow_cycles)
+        modes = ('closure', 'interval', 'condensation')
+        indices = [ReachabilityIndex(Graph(g.adjacency_map), mode) for mode in modes]
+        for u in g.vertices:
+            for v in g.vertices:
+                expected = bool(g.is_path(u, v))
+                for index in indices:
+                    assert index.reaches(u, v) == expected, "%s mode is wrong for %s->%s" % (index.mode, u, v)
+        for i in range(40):
+            u, v = random.randint(0, 79), random.randint(0, 79)
+            if u == v or v in g[u].edges:
+                continue
+            g.add_edge(u, v)
+            for index in indices:
+                index.add_edge(u, v)
+                assert not index.stale, "%s index went stale" % index.mode
+            for x in random.sample(range(80), 10):
+                for y in random.sample(range(80), 10):
+                    expected = bool(g.is_path(x, y))
+                    for index in indices:
+                        assert index.reaches(x, y) == expected, "%s mode is wrong after an insert" % index.mode
+    g = Graph.generate(30, 60)
+    assert g.reaches(0, 0) and all(g.reaches(0, v) == bool(g.is_path(0, v)) for v in g.vertices), "Graph.reaches is wrong"
+
+@timer
+def build(g, mode):
+    return ReachabilityIndex(g, mode)
+
+@timer
+def query_index(index, pairs):
+    return [index.reaches(u, v) for (u, v) in pairs]
+
+@timer
+def query_dfs(g, pairs):
+    return [bool(g.is_path(u, v)) for (u, v) in pairs]
+
+def test_reach_2():
+    sizes = [10**3, 10**4, 5*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 2*s, allow_cycles=False)
+        pairs = [(random.randint(0, s-1), random.randint(0, s-1)) for i in range(1000)]
+        expected = query_dfs(g, pairs)
+        for mode in ('closure', 'interval', 'condensation'):
+            if mode == 'closure' and s > CLOSURE_LIMIT:
+                continue
+            index = build(g, mode)
+            assert query_index(index, pairs) == expected, "%s mode is wrong" % mode
+            print("%s vertices, %s index: %s bytes" % (s, mode, index.nbytes))
+
+if __name__ == '__main__':
+    test_reach = testcase(test_reach)
+    test_reach_2 = testcase(test_reach_2)
+    call_tests(verbose=False)
+    show_stack()
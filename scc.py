@@ -56,6 +56,48 @@ def tarjan(g):
     # print("Lowlinks:\n%s" % lowlinks)
     return result
 
+def tarjan_iter(g):
+    """Finds the scc of graph g like tarjan, with an explicit stack of
+    (vertex, edge iterator) frames so deep graphs don't hit the recursion
+    limit. Components come out in reverse topological order"""
+    indices  = OD()
+    lowlinks = OD()
+    result   = OD()
+    fringe = []
+    enqueued = set()
+    for root in g.vertices:
+        if root in indices:
+            continue
+        indices[root] = lowlinks[root] = len(indices)
+        fringe.append(root)
+        enqueued.add(root)
+        work = [(root, iter(g[root].edges))]
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if w not in indices:
+                    # Successor w has not been visited, descend into it
+                    indices[w] = lowlinks[w] = len(indices)
+                    fringe.append(w)
+                    enqueued.add(w)
+                    work.append((w, iter(g[w].edges)))
+                    break
+                elif w in enqueued:
+                    lowlinks[v] = min(lowlinks[v], indices[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    lowlinks[u] = min(lowlinks[u], lowlinks[v])
+                if indices[v] == lowlinks[v]:
+                    result[v] = []
+                    w = None
+                    while w != v:
+                        w = fringe.pop()
+                        enqueued.discard(w)
+                        result[v].append(w)
+    return result
+
 @testcase
 @timer
 def test():
@@ -93,6 +135,16 @@ def test_2():
     res = tarjan(g)
     print("Result:\n%s" % res)
 
+@testcase
+def test_iter():
+    random.seed(2)
+    g = TimeableGraph.generate(300, 600)
+    assert tarjan_iter(g) == tarjan(g), "Iterative tarjan differs"
+    chain = Graph(range(5000))
+    chain.add_edges_from((i, i+1) for i in range(4999))
+    chain.add_edge(4999, 0)
+    assert len(tarjan_iter(chain)) == 1, "Deep cycle was split"
+
 @testcase
 def test_3():
     print("Hi")
@@ -0,0 +1,427 @@
+"""
+Shortest path trees kept per source, for query mixes that ask the same few
+sources for many goals. A tree is a paused Dijkstra search: it settles
+nodes only until the goal asked for is settled, and a later goal further
+out continues from the saved fringe instead of starting over.
+Trees live in an LRU cache bounded by an estimate of their bytes. Edges
+changed through the cache only drop the trees they can affect (an edge
+of the tree, or one that would shorten it), any other change to the
+graph is noticed through g.version and drops every tree.
+DynamicSSSP keeps one complete tree exact under edge changes by repairing
+only the part of it whose costs move.
+"""
+from __future__ import print_function
+import sys
+import random
+from heapq import *
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+
+TREE_BUDGET = 64 * 2**20 # default bytes of trees a TreeCache keeps
+ENTRY_BYTES = sys.getsizeof((0, None)) # one prevs or fringe tuple
+
+class Tree(object):
+    """
+    A Dijkstra search from start that can be paused and resumed.
+    -----------------------------------------------------
+    Data Structures:
+    costs: min cost found so far from start, exact once settled
+    prevs: the edge (w, u) that reached v, as in dk.dijkstra
+    settled: the vertices whose cost is final
+    fringe: the heap the search continues from, empty once complete
+    """
+    __slots__ = ('start', 'costs', 'prevs', 'settled', 'fringe')
+    def __init__(self, start):
+        self.start = start
+        self.costs = {start: 0}
+        self.prevs = {start: (0, None)}
+        self.settled = set()
+        self.fringe = [(0, start)]
+    @property
+    def complete(self):
+        return not self.fringe
+    @property
+    def nbytes(self):
+        """Rough size of the containers and the tuples they hold"""
+        return (sys.getsizeof(self.costs) + sys.getsizeof(self.prevs) +
+                sys.getsizeof(self.settled) + sys.getsizeof(self.fringe) +
+                ENTRY_BYTES * (len(self.prevs) + len(self.fringe)))
+    def advance(self, g, goal=None):
+        """Settles nodes until goal is settled, or every reachable node
+        when goal is None. Returns the number of nodes settled"""
+        costs, prevs, settled, fringe = self.costs, self.prevs, self.settled, self.fringe
+        count = 0
+        while fringe and goal not in settled:
+            cost, node = heappop(fringe)
+            if node in settled:
+                continue
+            settled.add(node)
+            count += 1
+            for (v, w) in g[node].edges.iteritems():
+                next_cost = cost+w
+                if next_cost < costs.get(v, float('inf')):
+                    costs[v] = next_cost
+                    prevs[v] = (w, node)
+                    heappush(fringe, (next_cost, v))
+        return count
+    def affected(self, u, v, w=None):
+        """Whether setting u->v to weight w (None to remove it) can change
+        a cost this tree holds or will go on to find. Edges out of an
+        unsettled node have not been relaxed yet, so they cannot"""
+        if u not in self.settled:
+            return False
+        prev = self.prevs.get(v)
+        if prev is not None and prev[1] == u:
+            return True
+        return w is not None and self.costs[u] + w < self.costs.get(v, float('inf'))
+
+class TreeCache(object):
+    """
+    LRU cache of per-source Trees on graph g, holding at most budget bytes
+    of trees (by Tree.nbytes) and always at least the latest one.
+    add_edge and remove_edge change g and keep every tree the edge cannot
+    affect, any other change to g drops the whole cache on the next query
+    """
+    def __init__(self, g, budget=TREE_BUDGET):
+        self._g = g
+        self._version = g.version
+        self.budget = budget
+        self._trees = OD()
+        self._bytes = 0
+        self.hits = self.misses = 0
+    def __len__(self):
+        return len(self._trees)
+    def __contains__(self, start):
+        return start in self._trees
+    @property
+    def nbytes(self):
+        return self._bytes
+    @property
+    def stale(self):
+        return self._g.version != self._version
+    def clear(self):
+        self._trees = OD()
+        self._bytes = 0
+        self._version = self._g.version
+    def _get(self, start):
+        """The tree of start, most recently used from now on"""
+        if self.stale:
+            self.clear()
+        tree = self._trees.pop(start, None)
+        if tree is None:
+            self.misses += 1
+            tree = Tree(start)
+        else:
+            self.hits += 1
+            self._bytes -= tree.nbytes
+        return tree
+    def _put(self, tree):
+        self._trees[tree.start] = tree
+        self._bytes += tree.nbytes
+        while self._bytes > self.budget and len(self._trees) > 1:
+            (start, old) = self._trees.popitem(last=False)
+            self._bytes -= old.nbytes
+    def tree(self, start):
+        """(costs, prevs) of every vertex reachable from start, like
+        dk.dijkstra(g, start) but without entries for unreachable vertices.
+        The dicts belong to the cache, treat them as read-only"""
+        tree = self._get(start)
+        tree.advance(self._g)
+        self._put(tree)
+        return (tree.costs, tree.prevs)
+    def query(self, start, goal, stats=None):
+        """
+        Continues the tree of start until goal is settled.
+        Same contract as dk.search: (cost, path) or (0, None).
+        stats receives the nodes settled by this query, 0 on a cached goal
+        """
+        tree = self._get(start)
+        count = tree.advance(self._g, goal)
+        self._put(tree)
+        print("Visited %s nodes" % count)
+        if stats is not None:
+            stats['settled'] = count
+        if goal not in tree.settled:
+            print("No path to %s nodes" % len(tree.settled))
+            return (0, None)
+        return get_path(tree.prevs, goal, start)
+    def _drop_affected(self, u, v, w=None):
+        for (start, tree) in list(self._trees.iteritems()):
+            if tree.affected(u, v, w):
+                del self._trees[start]
+                self._bytes -= tree.nbytes
+    def add_edge(self, u, v, w=1):
+        """Adds or reweights u->v on the graph, dropping only the trees it affects"""
+        self._g.add_edge(u, v, w)
+        self._sync(lambda: self._drop_affected(u, v, w))
+    def remove_edge(self, u, v):
+        """Removes u->v from the graph, dropping only the trees it affects"""
+        self._g.remove_edge(u, v)
+        self._sync(lambda: self._drop_affected(u, v))
+    def _sync(self, update):
+        """Applies update after one mutation of our own, or clears the cache
+        if the graph also changed elsewhere"""
+        if self._g.version != self._version + 1:
+            self.clear()
+            return
+        self._version = self._g.version
+        update()
+
+def cache_trees(g, budget=TREE_BUDGET):
+    """Attaches a TreeCache to g, which dk.search then answers from"""
+    g._trees = TreeCache(g, budget)
+    return g._trees
+
+class DynamicSSSP(object):
+    """
+    Shortest paths from start kept exact while edges change, repaired in
+    the style of Ramalingam and Reps instead of rerun. Takes over the
+    (costs, prevs) of dk.dijkstra(g, start), computed here when not given.
+    A cheaper edge u->v spreads new costs out from v, a dearer or removed
+    edge of the tree resets the subtree under it, seeds every vertex there
+    from its in-edges outside the subtree and settles it again. Either way
+    only the vertices whose cost changes are searched. Weights must be
+    non-negative, as for dijkstra.
+    -----------------------------------------------------
+    Data Structures:
+    costs: min cost from start, inf if unreachable
+    prevs: the edge (w, u) that reached v, (0, None) off the tree
+    children: the tree edges out of every vertex, u -> {v}
+    touched: the vertices the last update searched
+    Changes made to g other than through this object are noticed through
+    g.version and rebuild everything with dijkstra
+    """
+    def __init__(self, g, start, costs=None, prevs=None):
+        if not g.indexed:
+            g.index_in_edges()
+        self._g = g
+        self.start = start
+        if costs is None:
+            import dk
+            costs, prevs = dk.dijkstra(g, start)
+        self._version = g.version
+        self.costs = costs
+        self.prevs = prevs
+        self.children = {}
+        for (v, (w, u)) in prevs.iteritems():
+            if u is not None:
+                self.children.setdefault(u, set()).add(v)
+        self.touched = 0
+    def path(self, goal):
+        """Same contract as dk.search: (cost, path) or (0, None)"""
+        if self.costs.get(goal, float('inf')) == float('inf'):
+            return (0, None)
+        return get_path(self.prevs, goal, self.start)
+    def _link(self, v, cost, prev):
+        """Sets the cost of v and moves it under its new tree parent"""
+        old = self.prevs.get(v, (0, None))[1]
+        if old is not None:
+            self.children[old].discard(v)
+        if prev[1] is not None:
+            self.children.setdefault(prev[1], set()).add(v)
+        self.costs[v] = cost
+        self.prevs[v] = prev
+    def _settle(self, fringe, inside=None):
+        """Dijkstra from the seeded fringe, only into inside if given"""
+        g, costs = self._g, self.costs
+        touched = set()
+        while fringe:
+            cost, node = heappop(fringe)
+            if cost > costs[node]:
+                continue
+            touched.add(node)
+            for (v, w) in g[node].edges.iteritems():
+                next_cost = cost+w
+                if next_cost < costs[v] and (inside is None or v in inside):
+                    self._link(v, next_cost, (w, node))
+                    heappush(fringe, (next_cost, v))
+        return len(touched)
+    def _decrease(self, u, v, w):
+        """u->v got cheaper or was added"""
+        next_cost = self.costs[u] + w
+        if next_cost >= self.costs[v]:
+            return 0
+        self._link(v, next_cost, (w, u))
+        return self._settle([(next_cost, v)])
+    def _increase(self, v):
+        """The tree edge into v got dearer or was removed"""
+        subtree = {v}
+        stack = [v]
+        while stack:
+            for x in self.children.get(stack.pop(), ()):
+                if x not in subtree:
+                    subtree.add(x)
+                    stack.append(x)
+        for x in subtree:
+            self._link(x, float('inf'), (0, None))
+        fringe = []
+        g, costs = self._g, self.costs
+        for x in subtree:
+            best, prev = float('inf'), (0, None)
+            for (y, w) in g[x].in_edges.iteritems():
+                if y not in subtree and costs[y] + w < best:
+                    best, prev = costs[y] + w, (w, y)
+            if prev[1] is not None:
+                self._link(x, best, prev)
+                fringe.append((best, x))
+        heapify(fringe)
+        self._settle(fringe, subtree)
+        return len(subtree)
+    def _sync(self):
+        """False, after rebuilding, if the graph changed other than by the
+        one mutation of our own just made"""
+        if self._g.version != self._version + 1:
+            self.__init__(self._g, self.start)
+            return False
+        self._version = self._g.version
+        return True
+    def update_edge(self, u, v, w):
+        """Sets the weight of u->v, adding the edge if it is missing"""
+        old = self._g[u].get(v)
+        self._g.add_edge(u, v, w)
+        if not self._sync() or u == v:
+            return
+        if old is None or w < old:
+            self.touched = self._decrease(u, v, w)
+        elif w > old and self.prevs[v][1] == u:
+            self.touched = self._increase(v)
+        else:
+            self.touched = 0
+    def add_edge(self, u, v, w=1):
+        self.update_edge(u, v, w)
+    def remove_edge(self, u, v):
+        self._g.remove_edge(u, v)
+        if not self._sync():
+            return
+        self.touched = self._increase(v) if self.prevs[v][1] == u else 0
+
+def test_spt():
+    import dk
+    random.seed(4)
+    g = Graph.generate(80, 320, weight_range=(1, 20))
+    trees = TreeCache(g)
+    expected = {u: dk.dijkstra(g, u)[0] for u in g.vertices}
+    for u in range(0, 80, 9):
+        for v in random.sample(range(80), 20):
+            cost, path = trees.query(u, v)
+            if expected[u][v] == float('inf'):
+                assert path is None, "Found a path that DNE"
+                continue
+            assert cost == expected[u][v], "Wrong cost %s->%s" % (u, v)
+            assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    # a goal that is already settled costs nothing, one further out resumes
+    stats = {}
+    costs, prevs = dk.dijkstra(g, 0)
+    near, far = sorted((v for v in g.vertices if costs[v] < float('inf')), key=costs.get)[1::75]
+    trees.query(0, far)
+    trees.query(0, near, stats)
+    assert stats['settled'] == 0, "Cached goal was searched again"
+    assert trees.tree(0)[0] == {v: c for (v, c) in costs.iteritems() if c < float('inf')}, "Wrong tree"
+    # edges off every tree keep them, tree edges and shortcuts drop theirs
+    for u in range(0, 80, 9):
+        trees.tree(u)
+    starts = set(trees._trees)
+    on_tree = lambda x, y: any(t.prevs.get(y, (0, None))[1] == x for t in trees._trees.itervalues())
+    ((x, y), w) = next((e, w) for (e, w) in g.edgelist if not on_tree(*e))
+    trees.add_edge(x, y, w + 5)
+    trees.remove_edge(x, y)
+    assert set(trees._trees) == starts, "An edge off every tree dropped one"
+    (w, u) = trees._trees[0].prevs[far]
+    trees.add_edge(u, far, w + 5)
+    assert 0 not in trees, "A tree edge kept its tree"
+    trees.add_edge(9, far, 1)
+    assert 9 not in trees, "A shortcut kept its tree"
+    for u in g.vertices:
+        costs = dk.dijkstra(g, u)[0]
+        for v in g.vertices:
+            cost = costs[v] if costs[v] < float('inf') else 0
+            assert trees.query(u, v)[0] == cost, "Stale tree after an edge change"
+    g.add_vertex(80)
+    assert trees.stale and trees.query(0, 80) == (0, None) and len(trees) == 1, "Graph change kept the trees"
+    small = TreeCache(g, budget=1)
+    for u in range(10):
+        small.tree(u)
+    assert len(small) == 1 and 9 in small, "Budget was not enforced"
+    g._trees = None
+    cache_trees(g)
+    assert dk.search(g, 3, 7)[0] == dk.dijkstra(g, 3, 7)[0] and 3 in g._trees, "search skipped the cache"
+
+@timer
+def repeated_dijkstra(g, queries):
+    import dk
+    return [dk.dijkstra(g, u, v)[0] for (u, v) in queries]
+
+@timer
+def cached_queries(g, queries):
+    trees = TreeCache(g)
+    return [trees.query(u, v)[0] for (u, v) in queries]
+
+def test_spt_2():
+    sizes = [10**3, 10**4, 4*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        sources = random.sample(range(s), 5)
+        queries = [(random.choice(sources), random.randint(0, s-1)) for i in range(50)]
+        assert cached_queries(g, queries) == repeated_dijkstra(g, queries), "Cached costs differ"
+
+def test_dynamic():
+    import dk
+    random.seed(12)
+    g = Graph.generate(100, 400, weight_range=(1, 30))
+    sssp = DynamicSSSP(g, 0, *dk.dijkstra(g, 0))
+    for i in range(300):
+        ((u, v), w) = random.choice(g.edgelist)
+        op = random.random()
+        if op < 0.4:
+            sssp.update_edge(u, v, random.randint(1, 30))
+        elif op < 0.7:
+            sssp.remove_edge(u, v)
+        else:
+            x, y = random.randint(0, 99), random.randint(0, 99)
+            sssp.add_edge(x, y, random.randint(1, 30))
+        costs = dk.dijkstra(g, 0)[0]
+        assert sssp.costs == costs, "Repaired costs differ after update %s" % i
+        for v in random.sample(range(100), 5):
+            cost, path = sssp.path(v)
+            if path is not None:
+                assert sum(g[x][y] for (x, y) in zip(path, path[1:])) == cost, "Path does not cost %s" % cost
+    g.add_vertex(100)
+    g.add_edge(0, 100, 3)
+    sssp.update_edge(100, 1, 1)
+    assert sssp.costs == dk.dijkstra(g, 0)[0], "Outside change was not picked up"
+
+@timer
+def repair(sssp, updates):
+    touched = 0
+    for (u, v, w) in updates:
+        sssp.update_edge(u, v, w)
+        touched += sssp.touched
+    return touched
+
+@timer
+def rerun(g, updates):
+    import dk
+    for (u, v, w) in updates:
+        g.add_edge(u, v, w)
+        dk.dijkstra(g, 0)
+
+def test_dynamic_2():
+    sizes = [10**3, 10**4, 4*10**4]
+    for s in (sizes):
+        random.seed(10)
+        g = TimeableGraph.generate(s, 10*s, weight_range=(1, s))
+        sssp = DynamicSSSP(g, 0)
+        updates = [e + (random.randint(1, s),) for (e, w) in random.sample(g.edgelist, 20)]
+        print("Repairs searched %s vertices" % repair(sssp, updates))
+        rerun(g, updates)
+
+if __name__ == '__main__':
+    test_spt = testcase(test_spt)
+    test_spt_2 = testcase(test_spt_2)
+    test_dynamic = testcase(test_dynamic)
+    test_dynamic_2 = testcase(test_dynamic_2)
+    call_tests(verbose=False)
+    show_stack()
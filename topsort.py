@@ -1,9 +1,9 @@
 from __future__ import print_function
 import random
-from copy import deepcopy
 from collections import OrderedDict as OD
 from collections import Counter, deque
 from Graph import Vertex, Graph
+from views import EdgeFilterView
 
 def generate_graph(v, e):
     """Generates a graph with v vertices and e edges
@@ -30,7 +30,7 @@ def calc_indegrees(graph):
     return indegrees
 
 def topsort(g):
-    graph = deepcopy(g)
+    graph = EdgeFilterView(g) # removals only mask edges in the view
     indegrees = calc_indegrees(graph)
     sources = deque([v for v in graph.vertices if v not in indegrees])
     visited = []
@@ -52,7 +52,7 @@ def topsort(g):
 
 def topsort_2(original_graph):
     """Topsorts and then finds the longest path"""
-    graph = deepcopy(original_graph)
+    graph = EdgeFilterView(original_graph)
     indegrees = calc_indegrees(graph)
     sources = [name for name in graph.vertices if name not in indegrees]
     visited = OD()
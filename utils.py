@@ -1,5 +1,7 @@
 from __future__ import print_function
 import os
+import sys
+import gc
 from collections import deque
 from collections import OrderedDict as OD
 
@@ -34,6 +36,17 @@ class FileManager(object):
         os.system("mermaid %s > /dev/null" % fname)
         os.system("open %s" % rpath)
 
+class PausedGC(object):
+    """Pauses the cyclic garbage collector for a bulk build, since millions
+    of fresh containers otherwise set off repeated full collections"""
+    def __enter__(self):
+        self.enabled = gc.isenabled()
+        gc.disable()
+        return self
+    def __exit__(self, type, value, traceback):
+        if self.enabled:
+            gc.enable()
+
 def yielder(scalar, n):
     for i in xrange(n):
         yield scalar
@@ -58,3 +71,29 @@ def get_path(prevs, goal, start):
         cur = node
     return (path[start], path.keys()[::-1])
 
+
+def deep_sizeof(obj):
+    """Approximates the bytes held by obj and everything reachable from it.
+    Walks containers, instance dicts and slots iteratively so long
+    linked structures (e.g. OrderedDict internals) don't hit the recursion limit"""
+    seen = set()
+    total = 0
+    fringe = [obj]
+    while fringe:
+        o = fringe.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            fringe.extend(o.iterkeys())
+            fringe.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            fringe.extend(o)
+        if hasattr(o, '__dict__'):
+            fringe.append(o.__dict__)
+        for klass in type(o).__mro__:
+            for slot in klass.__dict__.get('__slots__', ()):
+                if hasattr(o, slot):
+                    fringe.append(getattr(o, slot))
+    return total
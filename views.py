@@ -0,0 +1,262 @@
+"""
+Read-only views over a graph that share its vertices instead of copying.
+Every view offers what the algorithms read from a Graph (g.vertices,
+g[name].edges, g.edgelist), and views can be stacked on top of each other.
+"""
+from __future__ import print_function
+import random
+from collections import Mapping
+
+from Graph import *
+from TimeUtils import *
+from utils import *
+
+class FilteredEdges(Mapping):
+    """{name: weight} edges of one vertex that the view keeps.
+    out says whether the mapping holds out-edges (name -> t) or in-edges"""
+    __slots__ = ('_edges', '_view', '_name', '_out')
+    def __init__(self, edges, view, name, out=True):
+        self._edges = edges
+        self._view = view
+        self._name = name
+        self._out = out
+    def _keep(self, t, w):
+        if self._out:
+            return self._view._keep(self._name, t, w)
+        return self._view._keep(t, self._name, w)
+    def __len__(self):
+        return sum(1 for t in self)
+    def __iter__(self):
+        return (t for (t, w) in self._edges.iteritems() if self._keep(t, w))
+    def __contains__(self, t):
+        return t in self._edges and self._keep(t, self._edges[t])
+    def __getitem__(self, t):
+        w = self._edges[t]
+        if not self._keep(t, w):
+            raise KeyError(t)
+        return w
+    def iteritems(self):
+        return ((t, w) for (t, w) in self._edges.iteritems() if self._keep(t, w))
+    def itervalues(self):
+        return (w for (t, w) in self.iteritems())
+
+class ViewVertex(object):
+    """A vertex of the underlying graph seen through a view's edge filter"""
+    __slots__ = ('_vertex', '_view')
+    def __init__(self, vertex, view):
+        self._vertex = vertex
+        self._view = view
+    @property
+    def name(self):
+        return self._vertex.name
+    @property
+    def value(self):
+        return self._vertex.value
+    @property
+    def edges(self):
+        return FilteredEdges(self._vertex.edges, self._view, self._vertex.name)
+    @property
+    def in_edges(self):
+        return FilteredEdges(self._vertex.in_edges, self._view, self._vertex.name, out=False)
+    def __getitem__(self, name):
+        return self.edges[name]
+    def get(self, name, default=None):
+        return self.edges.get(name, default)
+
+class ViewVertices(Mapping):
+    """The {name: vertex} mapping of a view"""
+    __slots__ = ('_view',)
+    def __init__(self, view):
+        self._view = view
+    def __len__(self):
+        return sum(1 for name in self)
+    def __iter__(self):
+        return self._view._names()
+    def __contains__(self, name):
+        return self._view._has(name)
+    def __getitem__(self, name):
+        return self._view[name]
+    def itervalues(self):
+        return (self._view[name] for name in self)
+    def iteritems(self):
+        return ((name, self._view[name]) for name in self)
+
+class GraphView(Graph):
+    """Base for views. A view keeps no vertices or edges of its own, it only
+    decides which of its base graph's it shows. Mutations raise TypeError,
+    change the base graph instead"""
+    def __init__(self, base):
+        self._base = base
+        self._custom_labels = base._custom_labels
+        self._source_cls = getattr(base, '_source_cls', type(base))
+        self._reversed = False
+        self._version = 0 # counts changes to the view itself, see version
+    @property
+    def base(self):
+        return self._base
+    @property
+    def version(self):
+        """Moves whenever the base graph or the view changes"""
+        return self._base.version + self._version
+    @property
+    def vertices(self):
+        return ViewVertices(self)
+    def __getitem__(self, name):
+        if not self._has(name):
+            raise KeyError(name)
+        return ViewVertex(self._base[name], self)
+    def _names(self):
+        return iter(self._base.vertices)
+    def _has(self, name):
+        return name in self._base.vertices
+    def _keep(self, u, v, w):
+        return True
+    @property
+    def edgelist(self):
+        """Rebuilt on every read, the base graph may change under the view"""
+        return list(self.iter_edges())
+    def iter_edges(self):
+        return (((v.name, t), w) for v in self.vertices.itervalues() for (t, w) in v.edges.iteritems())
+    @property
+    def indexed(self):
+        return getattr(self._base, 'indexed', False)
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("%s is a read-only view, mutate its base graph" % type(self).__name__)
+    add_vertex = remove_vertex = add_edge = remove_edge = _read_only
+    add_edges_from = remove_edges_from = remove_all_edges = _read_only
+    index_in_edges = reverse = _read_only
+
+class Subgraph(GraphView):
+    """The subgraph induced by names: those vertices and the edges between them"""
+    def __init__(self, base, names):
+        super(Subgraph, self).__init__(base)
+        self._keep_names = frozenset(names)
+    def _names(self):
+        return (name for name in self._base.vertices if name in self._keep_names)
+    def _has(self, name):
+        return name in self._keep_names and name in self._base.vertices
+    def _keep(self, u, v, w):
+        return u in self._keep_names and v in self._keep_names
+
+class EdgeFilterView(GraphView):
+    """Hides the edges for which predicate(u, v, w) is false and the edges
+    in the removed mask. remove_edge only adds to the mask, so algorithms
+    can delete edges from the view while the base graph stays intact"""
+    def __init__(self, base, predicate=None, removed=()):
+        super(EdgeFilterView, self).__init__(base)
+        self._predicate = predicate
+        self._removed = set(removed)
+    @property
+    def removed(self):
+        return self._removed
+    def _keep(self, u, v, w):
+        if (u, v) in self._removed:
+            return False
+        return self._predicate is None or self._predicate(u, v, w)
+    def remove_edge(self, u, v):
+        if v not in self[u].edges:
+            raise KeyError((u, v))
+        self._removed.add((u, v))
+        self._version += 1
+    def remove_edges_from(self, edges):
+        edges = [tuple(e[:2]) for e in edges]
+        for (u, v) in edges:
+            if v not in self[u].edges:
+                raise KeyError((u, v))
+        self._removed.update(edges)
+        self._version += 1
+    def restore_edge(self, u, v):
+        self._removed.discard((u, v))
+        self._version += 1
+
+def transposed(g):
+    """{v: {u: w}} for every edge u->v of g, the in-edges of a graph that
+    keeps no in-edge index. Built in O(E) and kept on g until its version
+    moves, g's own vertices are left alone"""
+    cached = getattr(g, '_transposed', None)
+    if cached is not None and cached[0] == g.version:
+        return cached[1]
+    adj = {name: {} for name in g.vertices}
+    for ((u, v), w) in g.iter_edges():
+        adj[v][u] = w
+    g._transposed = (g.version, adj)
+    return adj
+
+class TransposedVertex(object):
+    """A vertex seen with every edge flipped when its graph keeps no in-edge
+    index: edges come from the transposed adjacency, in_edges are its own"""
+    __slots__ = ('_vertex', '_edges')
+    def __init__(self, vertex, edges):
+        self._vertex = vertex
+        self._edges = edges
+    @property
+    def name(self):
+        return self._vertex.name
+    @property
+    def value(self):
+        return self._vertex.value
+    @property
+    def edges(self):
+        return self._edges
+    @property
+    def in_edges(self):
+        return self._vertex.edges
+    def __getitem__(self, name):
+        return self._edges[name]
+    def get(self, name, default=None):
+        return self._edges.get(name, default)
+
+class ReversedView(GraphView):
+    """The base graph with every edge flipped. Read through the base's
+    in-edge index when it keeps one, otherwise through transposed(base),
+    so the base graph is never indexed and may be frozen or a view"""
+    def __getitem__(self, name):
+        if self._base.indexed:
+            return ReversedVertex(self._base[name])
+        return TransposedVertex(self._base[name], transposed(self._base).get(name, NO_EDGES))
+    @property
+    def vertices(self):
+        if self._base.indexed:
+            return ReversedVertices(self._base.vertices)
+        return ViewVertices(self)
+
+def test_views():
+    random.seed(4)
+    g = ReversibleGraph.generate(60, 400, weight_range=(1, 20))
+    keep = range(0, 60, 2)
+    sub = Subgraph(g, keep)
+    h = Graph(keep)
+    h.add_edges_from((u, v, w) for ((u, v), w) in g.edgelist if u in sub.vertices and v in sub.vertices)
+    assert sorted(sub.edgelist) == sorted(h.edgelist), "Subgraph edges differ"
+    assert sub.adjacency_map == h.adjacency_map, "Subgraph adjacency differs"
+    assert all(bool(sub.is_path(0, v)) == bool(h.is_path(0, v)) for v in keep), "Subgraph paths differ"
+    rev = ReversedView(g)
+    r = ReversibleGraph(range(60))
+    r.add_edges_from((v, u, w) for ((u, v), w) in g.edgelist)
+    assert sorted(rev.edgelist) == sorted(r.edgelist), "Reversed view edges differ"
+    assert sorted(ReversedView(rev).edgelist) == sorted(g.edgelist), "Double reversal differs"
+    assert not g.indexed, "Reversed view indexed its base graph"
+    flip = lambda h: sorted(((v, u), w) for ((u, v), w) in h.edgelist)
+    frozen = g.freeze()
+    assert sorted(ReversedView(frozen).edgelist) == flip(frozen), "Reversed frozen edges differ"
+    assert sorted(ReversedView(sub).edgelist) == flip(sub), "Reversed subgraph edges differ"
+    g.add_edge(0, 1, 99)
+    assert rev[1][0] == 99 and sorted(rev.edgelist) == flip(g), "Reversed view missed a change"
+    g.index_in_edges()
+    assert sorted(rev.edgelist) == flip(g), "Indexed reversed edges differ"
+    heavy = EdgeFilterView(g, lambda u, v, w: w > 10)
+    assert all(w > 10 for (e, w) in heavy.edgelist), "Filter kept a light edge"
+    ((u, v), w) = heavy.edgelist[0]
+    heavy.remove_edge(u, v)
+    assert v not in heavy[u].edges and g[u][v] == w, "Mask leaked into the base graph"
+    try:
+        sub.add_edge(0, 2)
+    except TypeError:
+        print("View refused a mutation")
+    else:
+        raise AssertionError("View accepted a mutation")
+
+if __name__ == '__main__':
+    test_views = testcase(test_views)
+    call_tests(verbose=False)
+    show_stack()